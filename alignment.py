@@ -0,0 +1,109 @@
+import sys
+import numpy as np
+
+from resampling import make_time_index, resample
+
+# An offset is only trusted when the series correlate at least this much
+# where they overlap, and when they overlap over at least this fraction
+# of the shortest one. Otherwise there is nothing to align them on.
+MIN_CORRELATION = 0.6
+MIN_OVERLAP = 0.5
+
+
+def cross_correlate(a, b):
+    # Cross-correlation of `a` and `b` at every lag, computed with FFTs
+    # in O(n log n). Entry k holds the correlation of `a` with `b`
+    # delayed by k - (len(b) - 1) samples.
+    n = len(a) + len(b) - 1
+    nfft = 1 << (n - 1).bit_length()
+    corr = np.fft.irfft(np.fft.rfft(a, nfft)*np.fft.rfft(b[::-1], nfft), nfft)
+    return corr[:n]
+
+
+def _normalize(values):
+    values = np.asarray(values, dtype=np.float64)
+    values = values - values.mean()
+    std = values.std()
+    if std == 0 or not np.isfinite(std):
+        return None
+    return values/std
+
+
+def _finite_samples(times, values):
+    times = np.asarray(times, dtype=np.float64)
+    values = np.asarray(values, dtype=np.float64)
+    finite = np.isfinite(values)
+    return times[finite], values[finite]
+
+
+def estimate_offset(ref_times, ref_values, times, values, period=1, max_offset=None, ref_width=None,
+                    min_correlation=MIN_CORRELATION, min_overlap=MIN_OVERLAP):
+    # Estimates the offset, in seconds, to add to `times` so that the
+    # series lines up with the reference one. Both are resampled with
+    # the same period and the offset is the lag with the highest
+    # cross-correlation, it is only as precise as `period`. Samples
+    # that aren't finite (i.e. empty resampling buckets) are ignored.
+    # Returns None when the series don't correlate, or overlap, enough
+    # at that lag (see MIN_CORRELATION and MIN_OVERLAP).
+    #
+    # When `ref_width` is given, each reference sample is the value of the
+    # bucket [t, t + ref_width) (i.e. SRUMUTIL minutes) and it is held over
+    # that bucket instead of being interpolated as a point sample at `t`,
+    # which would shift the estimate by half a bucket.
+    ref_times, ref_values = _finite_samples(ref_times, ref_values)
+    times, values = _finite_samples(times, values)
+    if len(ref_times) < 2 or len(times) < 2:
+        return None
+
+    if ref_width is None:
+        ref_grid = make_time_index(ref_times[0], ref_times[-1] + period, period)
+        ref = resample(ref_times, ref_values, ref_grid)
+    else:
+        ref_grid = make_time_index(ref_times[0], ref_times[-1] + ref_width, period)
+        ref = resample(ref_times, ref_values, ref_grid, method='last')
+    grid = make_time_index(times[0], times[-1] + period, period)
+
+    ref = _normalize(ref)
+    series = _normalize(resample(times, values, grid))
+    if ref is None or series is None:
+        # A flat series can't be aligned with anything
+        return None
+
+    lags = np.arange(-(len(series) - 1), len(ref))
+    offsets = ref_grid[0] - grid[0] + lags*period
+    corr = cross_correlate(ref, series)
+    if max_offset is not None:
+        corr[np.abs(offsets) > max_offset] = -np.inf
+
+    best = np.argmax(corr)
+    overlap = min(len(ref), lags[best] + len(series)) - max(0, lags[best])
+    if overlap < min_overlap*min(len(ref), len(series)) or corr[best]/overlap < min_correlation:
+        return None
+
+    return float(offsets[best])
+
+
+def check_known_shifts(shifts=(0, 40, -75, 120), minutes=30, bucket=60):
+    # Builds a WPA-like CPU usage series in sync with per-minute SRUMUTIL-like
+    # sums, shifts it by known amounts, and checks that estimate_offset
+    # finds exactly those shifts again.
+    rng = np.random.default_rng(0)
+    times = np.arange(0, minutes*bucket, 1, dtype=np.float64)
+    usage = np.repeat(rng.random(minutes)*100, bucket) + rng.random(len(times))*5
+    ref_times = make_time_index(0, minutes*bucket, bucket)
+    ref_values = resample(times, usage, ref_times, method='sum')
+
+    same = True
+    for shift in shifts:
+        offset = estimate_offset(
+            ref_times, ref_values, times - shift, usage,
+            period=1, max_offset=4*bucket, ref_width=bucket
+        )
+        if offset != shift:
+            print("Estimated an offset of %s seconds for a shift of %s seconds" % (offset, shift))
+            same = False
+    return same
+
+
+if __name__=="__main__":
+    sys.exit(0 if check_known_shifts() else 1)
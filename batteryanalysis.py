@@ -0,0 +1,159 @@
+import math
+import numpy as np
+
+from changepoints import find_change_points, get_capacity_steps
+from utils import (
+    milliwatthours_to_millijoules,
+    millijoules_to_milliwatts
+)
+
+# Number of samples averaged when smoothing the capacity and drain rate
+CAPACITY_SMOOTHING = 20
+DRAIN_SMOOTHING = 15
+
+# Two-sided 95% critical values of Student's t distribution, keyed
+# on the degrees of freedom. Missing ones use the next lowest key.
+T_CRITICAL_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571,
+    6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+    16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060,
+    26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+    40: 2.021, 60: 2.000, 120: 1.980
+}
+
+
+def moving_average(values, n):
+    # Only keeps the averages over full windows, i.e. len(values) - n + 1 of them
+    cumsum = np.concatenate(([0], np.cumsum(np.asarray(values, dtype=np.float64))))
+    return (cumsum[n:] - cumsum[:-n])/n
+
+
+def get_battery_deltas(capacities, timewindow=60):
+    # Drain rate, in mW, between each consecutive capacity (in mWh)
+    capacities = np.asarray(capacities, dtype=np.float64)
+    return millijoules_to_milliwatts(
+        milliwatthours_to_millijoules(capacities[:-1] - capacities[1:]),
+        timewindow
+    )
+
+
+def find_first_drain(deltas, offset=0):
+    # Index of the first sample where the battery drains, moved by `offset`
+    drains = np.flatnonzero(np.asarray(deltas) > 0)
+    if len(drains) == 0:
+        return 0
+    return max(int(drains[0]) + offset, 0)
+
+
+def find_final_drain(capacities):
+    # Index where the capacity last changes (the start of the final
+    # plateau), or 0 if it never changes
+    changes = find_change_points(capacities)
+    if len(changes) == 0:
+        return 0
+    return int(changes[-1])
+
+
+def get_drain_rate(capacities, start, end, interval=60):
+    # Average drain rate, in mW, between two samples
+    drain_time = interval*(end - start)
+    if drain_time <= 0:
+        return 0
+    return float(abs(millijoules_to_milliwatts(
+        milliwatthours_to_millijoules((capacities[start] - capacities[end])),
+        abs(drain_time)
+    )))
+
+
+def get_t_critical(dof):
+    if dof > max(T_CRITICAL_95):
+        return 1.960
+    return T_CRITICAL_95[max(k for k in T_CRITICAL_95 if k <= dof)]
+
+
+def fit_drain_rate(times, capacities):
+    # Least squares fit of the capacity (in mWh) over time (in seconds).
+    # Returns the drain rate in mW along with its 95% confidence interval,
+    # the interval needs at least three points.
+    times = np.asarray(times, dtype=np.float64)
+    capacities = np.asarray(capacities, dtype=np.float64)
+    if len(times) < 2:
+        return None
+
+    tdev = times - times.mean()
+    sxx = np.dot(tdev, tdev)
+    if sxx == 0:
+        return None
+    slope = np.dot(tdev, capacities - capacities.mean())/sxx
+    drain = float(millijoules_to_milliwatts(milliwatthours_to_millijoules(-slope), 1))
+
+    low = high = float('nan')
+    if len(times) > 2:
+        residuals = capacities - capacities.mean() - slope*tdev
+        stderr = math.sqrt(np.dot(residuals, residuals)/(len(times) - 2)/sxx)
+        margin = get_t_critical(len(times) - 2)*float(
+            millijoules_to_milliwatts(milliwatthours_to_millijoules(stderr), 1)
+        )
+        low = drain - margin
+        high = drain + margin
+
+    return {
+        'drain_mw': drain,
+        'low_mw': low,
+        'high_mw': high,
+        'points': len(times)
+    }
+
+
+def fit_step_edges(capacities, steps, first_drain=0, interval=60):
+    # The capacity is quantized, but right at a step it is as close as it
+    # gets to the real value. Fitting the drain over the step edges gives
+    # a precise rate long before the first and last steps are far apart.
+    edges = steps[(steps > 0) & (steps >= first_drain)]
+    return fit_drain_rate(interval*edges, np.asarray(capacities)[edges])
+
+
+def analyze_battery(capacities, smooth=False, start_offset=0, time_to_analyze=None, interval=60):
+    # Analyzes a list of battery capacities (in mWh) taken every `interval`
+    # seconds. Returns the (smoothed and cut) capacities, the drain rates
+    # between them, where the battery starts and stops draining, the
+    # average drain of every step between capacity changes, and the drain
+    # rate fitted over the step edges (None without enough steps). The
+    # steps and the fit always come from the raw capacities.
+    raw = np.asarray(capacities, dtype=np.float64)
+    capacities = raw
+    if smooth:
+        capacities = moving_average(capacities, CAPACITY_SMOOTHING)
+
+    deltas = get_battery_deltas(capacities, timewindow=interval)
+    if smooth:
+        deltas = moving_average(deltas, DRAIN_SMOOTHING)
+
+    first_drain = find_first_drain(deltas, offset=start_offset)
+    if time_to_analyze:
+        end = first_drain + int(math.ceil(time_to_analyze/interval))
+        deltas = deltas[:end]
+        capacities = capacities[:end]
+
+    # Smoothing is only for the plots and the average drain. Every smoothed
+    # sample would be a step, with correlated errors, so the steps and the
+    # fit (along with its confidence interval) always use the raw capacities.
+    raw_first_drain = find_first_drain(get_battery_deltas(raw, timewindow=interval), offset=start_offset)
+    if time_to_analyze:
+        raw = raw[:raw_first_drain + int(math.ceil(time_to_analyze/interval))]
+
+    steps = get_capacity_steps(raw, interval=interval)
+    fit = fit_step_edges(raw, steps['steps'], first_drain=raw_first_drain, interval=interval)
+
+    return {
+        'capacity': capacities,
+        'deltas': deltas,
+        'first_drain': first_drain,
+        'final_drain': find_final_drain(capacities),
+        'steps': steps['steps'],
+        'step_times': steps['step_times'],
+        'step_drains_mw': steps['drains_mw'],
+        'fit': fit
+    }
@@ -1,12 +1,29 @@
 import re
+import time
+import datetime
+import functools
+import numpy as np
 
-from utils import get_paths_from_dir
+from snapshotcache import SnapshotCache
+from utils import get_paths_from_dir, parallel_map
 
+# Bump whenever the parsed output changes to invalidate cached reports
+BATTERY_PARSER_VERSION = 1
 
-def parse_battery_report(fname):
-	with open(fname, 'r') as html_file:
-		html_lines = html_file.readlines()
 
+REPORT_LINE_PATTERN = re.compile(r'Report generated')
+PERCENT_PATTERN = re.compile(r'"percent">(\d+)')
+CAPACITY_PATTERN = re.compile(r'"mw">(.*) mWh')
+RECENT_USAGE_PATTERN = re.compile(r'Recent usage')
+DATE_PATTERN = re.compile(r'class="date">([^<]*)<')
+TIME_PATTERN = re.compile(r'class="time">([^<]*)<')
+
+
+class BatteryReportError(ValueError):
+	pass
+
+
+def parse_battery_report(fname):
 	creationtime = int(fname.split('.')[0].split('report')[-1])
 
 	reportLineFound = False
@@ -14,34 +31,119 @@ def parse_battery_report(fname):
 
 	percentage = 0
 
-	for i, line in enumerate(html_lines):
-		if reportLineFound == False:
-			matchObj = re.match(r'.*Report generated.*', line)
-			if matchObj:
-				reportLineFound = True
+	# The values we need are near the top of the report, read it
+	# line by line and stop as soon as they are found.
+	with open(fname, 'r') as html_file:
+		for line in html_file:
+			if reportLineFound == False:
+				if REPORT_LINE_PATTERN.search(line):
+					reportLineFound = True
 				continue
 
-		if reportLineFound:
-			matchObj = re.match(r'.*"percent">(\d+).*', line)
+			matchObj = PERCENT_PATTERN.search(line)
 			if matchObj:
 				percentageFound = True
 				percentage = matchObj.group(1)
 				continue
 
-		if percentageFound:
-			matchObj = re.match(r'.*"mw">(.*) mWh.*', line)
-			if matchObj:
-				capacity = matchObj.group(1)
-				capacity = re.sub(r',','', capacity)
-				html_file.close()
-				return {
-					"creationtime": creationtime,
-					"battery" : int(percentage),
-					"capacity" : int(capacity)
-				}
+			if percentageFound:
+				matchObj = CAPACITY_PATTERN.search(line)
+				if matchObj:
+					capacity = matchObj.group(1).replace(',', '')
+					try:
+						return {
+							"creationtime": creationtime,
+							"battery" : int(percentage),
+							"capacity" : int(capacity)
+						}
+					except ValueError:
+						raise BatteryReportError(
+							"Bad capacity value %s in the battery report named %s" % (capacity, fname)
+						)
+
+	raise BatteryReportError("Something is wrong with the battery report named %s" % fname)
+
+
+def get_creationtime_seconds(creationtime):
+	# The batch script names reports with a time in milliseconds
+	if creationtime > 10**11:
+		return creationtime // 1000
+	return creationtime
+
+
+def parse_battery_history_row(row, currdate):
+	date = DATE_PATTERN.search(row)
+	if date and date.group(1).strip():
+		currdate = date.group(1).strip()
+
+	tstamp = TIME_PATTERN.search(row)
+	percentage = PERCENT_PATTERN.search(row)
+	capacity = CAPACITY_PATTERN.search(row)
+	if not (currdate and tstamp and percentage and capacity):
+		return currdate, None
+
+	try:
+		entrytime = int(time.mktime(datetime.datetime.strptime(
+			currdate + ' ' + tstamp.group(1).strip(), "%Y-%m-%d %H:%M:%S"
+		).timetuple()))
+		entry = (int(percentage.group(1)), int(capacity.group(1).strip().replace(',', '')))
+	except ValueError:
+		# Rows without a capacity (i.e. a '-') are skipped
+		return currdate, None
+
+	return currdate, (entrytime, entry)
+
+
+def parse_battery_history(fname):
+	# Every report holds the "Recent usage" table, a timestamped list of
+	# the remaining capacity over the last few days. Parse all of it.
+	creationtime = int(fname.split('.')[0].split('report')[-1])
+
+	history = {}
+	sectionFound = False
+	currdate = None
+	row = None
+	with open(fname, 'r') as html_file:
+		for line in html_file:
+			if sectionFound == False:
+				if RECENT_USAGE_PATTERN.search(line):
+					sectionFound = True
+				continue
 
-	print("Something is wrong with the battery report named %s" % fname)
-	return None
+			if '<tr' in line:
+				row = ''
+			if row is not None:
+				row += line
+				if '</tr>' in line:
+					currdate, entry = parse_battery_history_row(row, currdate)
+					if entry:
+						history[entry[0]] = entry[1]
+					row = None
+			if '</table>' in line:
+				break
+
+	if not sectionFound:
+		raise BatteryReportError("Can't find the recent usage in the battery report named %s" % fname)
+
+	return {
+		"creationtime": creationtime,
+		"history": history
+	}
+
+
+def resample_battery_history(history, starttime, endtime, interval=60):
+	# Hold the last known value at every `interval` seconds, the
+	# same sampling that one report per minute would give us.
+	if not history:
+		raise BatteryReportError("No capacity history found in the battery reports")
+
+	times = np.asarray(sorted(history), dtype=np.int64)
+	grid = np.arange(starttime, endtime + 1, interval, dtype=np.int64)
+	inds = np.clip(np.searchsorted(times, grid, side='right') - 1, 0, len(times) - 1)
+	return {
+		str(t): history[times[i]]
+		for t, i in zip(grid.tolist(), inds.tolist())
+	}
 
 
 def get_batteryreport_files(datadir):
@@ -49,14 +151,93 @@ def get_batteryreport_files(datadir):
 	return files
 
 
-def open_battery_reports(datadir):
+def load_battery_report(fname, cache=None):
+	params = ()
+	if cache is not None:
+		arrays = cache.load(fname, params, BATTERY_PARSER_VERSION)
+		if arrays is not None:
+			return {
+				"creationtime": int(arrays['creationtime']),
+				"battery": int(arrays['battery']),
+				"capacity": int(arrays['capacity'])
+			}
+
+	data = parse_battery_report(fname)
+	if cache is not None:
+		cache.store(fname, params, BATTERY_PARSER_VERSION, {
+			key: np.asarray(val, dtype=np.int64) for key, val in data.items()
+		})
+	return data
+
+
+def load_battery_history(fname, cache=None):
+	params = ('history',)
+	if cache is not None:
+		arrays = cache.load(fname, params, BATTERY_PARSER_VERSION)
+		if arrays is not None:
+			return {
+				"creationtime": int(arrays['creationtime']),
+				"history": {
+					t: (pc, cap) for t, pc, cap in zip(
+						arrays['times'].tolist(),
+						arrays['battery'].tolist(),
+						arrays['capacity'].tolist()
+					)
+				}
+			}
+
+	data = parse_battery_history(fname)
+	if cache is not None:
+		times = sorted(data['history'])
+		cache.store(fname, params, BATTERY_PARSER_VERSION, {
+			'creationtime': np.asarray(data['creationtime'], dtype=np.int64),
+			'times': np.asarray(times, dtype=np.int64),
+			'battery': np.asarray([data['history'][t][0] for t in times], dtype=np.int64),
+			'capacity': np.asarray([data['history'][t][1] for t in times], dtype=np.int64)
+		})
+	return data
+
+
+def open_battery_history(files, jobs=None, cache=None):
+	if not files:
+		raise BatteryReportError("No battery reports found to get the capacity history from")
+
+	load = functools.partial(load_battery_history, cache=cache)
+	reports = sorted(
+		parallel_map(load, files, jobs=jobs),
+		key=lambda data: data['creationtime']
+	)
+
+	# Newer reports take precedence for entries they have in common
+	history = {}
+	for data in reports:
+		history.update(data['history'])
+
+	# Only keep the time between the first and last report
+	starttime = get_creationtime_seconds(reports[0]['creationtime'])
+	endtime = get_creationtime_seconds(reports[-1]['creationtime'])
+	print("Battery entries found in the report history: %s" % len(history))
+	return resample_battery_history(history, starttime, endtime)
+
+
+def open_battery_reports(datadir, jobs=None, use_cache=False, history=False):
 	files = get_batteryreport_files(datadir)
 
+	cache = SnapshotCache(datadir) if use_cache else None
+	if history:
+		currdata = open_battery_history(files, jobs=jobs, cache=cache)
+		if cache is not None:
+			cache.evict()
+		return currdata
+
+	load = functools.partial(load_battery_report, cache=cache)
+
 	currdata = {}
-	for file in files:
+	for data in parallel_map(load, files, jobs=jobs):
 		# Data is in mWh by default
-		data = parse_battery_report(file)
 		currdata[str(data['creationtime'])] = (data['battery'], data['capacity'])
 
-	return currdata
+	if cache is not None:
+		cache.evict()
 
+	return currdata
@@ -0,0 +1,37 @@
+import numpy as np
+
+from utils import (
+    milliwatthours_to_millijoules,
+    millijoules_to_milliwatts
+)
+
+
+def find_change_points(values):
+    # Indices where a value differs from the one before it. The first
+    # sample is always included as it starts the first segment.
+    values = np.asarray(values)
+    if len(values) == 0:
+        return np.zeros(0, dtype=np.int64)
+    return np.concatenate(([0], np.flatnonzero(values[1:] != values[:-1]) + 1))
+
+
+def get_capacity_steps(capacities, times=None, interval=60):
+    # Splits the battery capacities (in mWh) into the segments between each
+    # capacity change. For every segment, returns where it starts, how
+    # long it lasts (in seconds) and the average drain over it (in mW).
+    # Without `times`, the capacities are taken every `interval` seconds.
+    capacities = np.asarray(capacities, dtype=np.float64)
+    steps = find_change_points(capacities)
+    if times is None:
+        step_times = interval*np.diff(steps)
+    else:
+        step_times = np.diff(np.asarray(times)[steps])
+
+    return {
+        'steps': steps,
+        'step_times': step_times,
+        'drains_mw': np.abs(millijoules_to_milliwatts(
+            milliwatthours_to_millijoules(capacities[steps[:-1]] - capacities[steps[1:]]),
+            step_times
+        ))
+    }
@@ -0,0 +1,72 @@
+import argparse
+import sys
+import numpy as np
+
+from batteryanalysis import fit_drain_rate
+from batteryusageparser import (
+	BatteryReportError,
+	get_batteryreport_files,
+	get_creationtime_seconds,
+	load_battery_report
+)
+from changepoints import find_change_points
+from snapshotcache import SnapshotCache
+
+
+def drainparser():
+	parser = argparse.ArgumentParser(
+		description='Checks if the battery drain rate measured so far is precise enough '
+					'to stop the test. Exits with 0 when it is, and 1 otherwise.'
+	)
+
+	parser.add_argument('--test-dir', type=str, required=True,
+						help='Directory holding the battery reports of the test.')
+
+	parser.add_argument('--tolerance', type=float, required=True,
+						help='Largest half-width (in mW) of the 95%% confidence interval of the drain rate.')
+
+	parser.add_argument('--min-steps', type=int, default=10,
+						help='Capacity steps to wait for before the drain rate can be trusted (default is 10).')
+
+	return parser
+
+
+def main():
+	parser = drainparser()
+	args = parser.parse_args()
+	args = dict(vars(args))
+
+	# Reports that were already parsed come from the cache. Like WinPowerUsage,
+	# malformed ones (e.g. still being written) are skipped instead of failing
+	# every check for the rest of the test.
+	cache = SnapshotCache(args['test_dir'])
+	reports = {}
+	for fname in get_batteryreport_files(args['test_dir']):
+		try:
+			data = load_battery_report(fname, cache=cache)
+		except BatteryReportError as e:
+			print("Skipping a battery report: %s" % str(e))
+			continue
+		reports[data['creationtime']] = data['capacity']
+	cache.evict()
+
+	keys = sorted(reports)
+	times = np.asarray([get_creationtime_seconds(key) for key in keys])
+	capacities = np.asarray([reports[key] for key in keys])
+
+	edges = find_change_points(capacities)[1:]
+	if len(edges) < args['min_steps']:
+		print("Only %s capacity steps found so far." % len(edges))
+		sys.exit(1)
+
+	fit = fit_drain_rate(times[edges], capacities[edges])
+	if fit is None:
+		sys.exit(1)
+
+	margin = (fit['high_mw'] - fit['low_mw'])/2
+	print("Current drain rate: %s mW (+/- %s mW)" % (fit['drain_mw'], margin))
+	sys.exit(0 if margin <= args['tolerance'] else 1)
+
+
+if __name__=="__main__":
+	main()
@@ -1,58 +1,67 @@
+import math
 import numpy as np
 from matplotlib import pyplot as plt
 
 from powerusageparser import open_srumutil_data
 from batteryusageparser import open_battery_reports
 from wpaparser import get_wpa_data
-from utils import (
-    get_ordered_datalist_battery,
-    get_ordered_datalist_power,
-    milliwatthours_to_millijoules,
-    millijoules_to_milliwatts
-)
+from resampling import align_to_index
+from alignment import estimate_offset
+from downsampling import plot_downsampled
+from batteryanalysis import analyze_battery, get_drain_rate
+from timewindows import BatteryIndex, EnergyIndex, sliding_windows
+from utils import get_ordered_datalist_battery
 
 DIST_BETWEEN_SAMPLES = 60
 
 
-def get_avg_consumption_rate(ordered_datalist, total_time, milliwatthour=False, header=None, consumption_from=None):
-    consumption = []
-    for row in ordered_datalist:
-        consumption.append([
-            x for i, x in enumerate(row) if (not consumption_from) or (header[i] in consumption_from)
-        ])
-
-    if milliwatthour:
-        avg_consumption = [sum(x)/3600 for x in zip(*consumption)]
-    else:
-        avg_consumption = [sum(x)/total_time for x in zip(*consumption)]
-    return avg_consumption
-
-
-def get_battery_deltas(ordered_datalist, timewindow=60):
-    deltas = []
-    for i in range(len(ordered_datalist)):
-        if i >= len(ordered_datalist) - 1:
-            continue
-        deltas.append(millijoules_to_milliwatts(
-            milliwatthours_to_millijoules((ordered_datalist[i]-ordered_datalist[i+1])),
-            timewindow
-        ))
-    return deltas
+def get_avg_consumption_rates(series, total_time, consumption_from=None):
+    # The columns are summed once, and both the average
+    # rate in mW and the total in mWh are derived from it.
+    totals = series.values[:, series.column_mask(consumption_from)].sum(axis=0)
+    return (totals/total_time).tolist(), (totals/3600).tolist()
 
 
 def cut_time_out(data, start_ind=0, time_to_analyze=None, interval=60):
     if not time_to_analyze:
         return data
 
-    newdata = data[:start_ind]
-    currtime = 0
-    for val in data[start_ind:]:
-        if currtime >= time_to_analyze:
-            break
-        newdata.append(val)
-        currtime += interval
+    # Slicing keeps SRUMSeries and arrays as views on the same data
+    return data[:start_ind + int(math.ceil(time_to_analyze/interval))]
+
 
-    return newdata
+def get_windows_csv(series, reports, length, step=None, consumption_from=None):
+    # Average power and battery drain over sliding windows of a
+    # phase, the window times are relative to the first sample.
+    names = [name for name, keep in zip(series.header, series.column_mask(consumption_from)) if keep]
+    header = ','.join(['window-start', 'window-end'] + [name + '-mw' for name in names] + ['battery-mw'])
+    if len(series) == 0:
+        return header
+
+    energy = EnergyIndex(series)
+    battery = BatteryIndex.from_reports(reports)
+
+    firsttime = series.times[0]
+    lasttime = series.times[-1] + DIST_BETWEEN_SAMPLES
+
+    # SRUMUTIL times come from local timestamps and battery reports from
+    # the epoch in their names, if they don't line up the drain is off.
+    coverage = battery.coverage(firsttime, lasttime)
+    if coverage < 0.9:
+        print(
+            "Warning, the battery reports only cover %s%% of the SRUMUTIL data, check "
+            "that both use the same clock (i.e. time zone). Windows outside of the "
+            "battery reports have no battery drain." % round(100*coverage, 1)
+        )
+
+    starts, ends = sliding_windows(firsttime, lasttime, length, step=step)
+    rows = np.column_stack([
+        starts - firsttime,
+        ends - firsttime,
+        energy.average_power(starts, ends, columns=consumption_from),
+        battery.drain_rate(starts, ends)
+    ])
+    return header + '\n' + '\n'.join(','.join(str(x) for x in row) for row in rows.tolist())
 
 
 def compare_data(baselinedir, testdir, config, args):
@@ -64,7 +73,11 @@ def compare_data(baselinedir, testdir, config, args):
         args['baseline_application'],
         args['exclude_baseline_apps'],
         config['baselinestarttime'] if 'baselinestarttime' in config else 600,
-        args['baseline_time']
+        args['baseline_time'],
+        incremental=args['incremental_ingest'],
+        jobs=args['jobs'],
+        use_cache=not args['no_cache'],
+        consumption_from=args['consumption_from']
     )
     print("Getting SRUMUTIL testing data...")
     _, testdata = open_srumutil_data(
@@ -72,13 +85,23 @@ def compare_data(baselinedir, testdir, config, args):
         args['application'],
         args['exclude_test_apps'],
         config['teststarttime'],
-        args['test_time']
+        args['test_time'],
+        incremental=args['incremental_ingest'],
+        jobs=args['jobs'],
+        use_cache=not args['no_cache'],
+        consumption_from=args['consumption_from']
     )
 
     print("Getting battery reports for baseline...")
-    baseline_reports = open_battery_reports(baselinedir)
+    baseline_reports = open_battery_reports(
+        baselinedir, jobs=args['jobs'], use_cache=not args['no_cache'],
+        history=args['battery_history']
+    )
     print("Getting battery reports for test...")
-    test_reports = open_battery_reports(testdir)
+    test_reports = open_battery_reports(
+        testdir, jobs=args['jobs'], use_cache=not args['no_cache'],
+        history=args['battery_history']
+    )
 
     print("Running comparison")
 
@@ -95,163 +118,35 @@ def compare_data(baselinedir, testdir, config, args):
     for i,_ in enumerate(ord_baseline):
         x_range.append(DIST_BETWEEN_SAMPLES*i)
 
-    if args['smooth_battery']:
-        N = 20
-        cumsum, moving_aves = [0], []
-
-        for i, x in enumerate(ord_baseline, 1):
-            cumsum.append(cumsum[i-1] + x)
-            if i>=N:
-                moving_ave = (cumsum[i] - cumsum[i-N])/N
-                moving_aves.append(moving_ave)
-
-        ord_baseline = moving_aves
-
-    deltas_base = get_battery_deltas(ord_baseline, timewindow=60)
-    deltas_test = get_battery_deltas(ord_test, timewindow=60)
-
-    if args['smooth_battery']:
-        N = 15
-        cumsum, moving_aves = [0], []
-
-        for i, x in enumerate(deltas_base, 1):
-            cumsum.append(cumsum[i-1] + x)
-            if i>=N:
-                moving_ave = (cumsum[i] - cumsum[i-N])/N
-                #can do stuff with moving_ave here
-                moving_aves.append(moving_ave)
-        deltas_base = moving_aves
-
-    # Determine baseline boundaries
-    found_decrease = 0
-    first_good_base = 0
-    for i, val in enumerate(deltas_base):
-        if val <= 0:
-            continue
-        else:
-            first_good_base = i
-            if first_good_base < 0:
-                first_good_base = 0
-            break
-
-    if args['time_to_analyze']:
-        deltas_base = cut_time_out(
-            deltas_base, start_ind=first_good_base, time_to_analyze=args['time_to_analyze']
-        )
-        ord_baseline = cut_time_out(
-            ord_baseline, start_ind=first_good_base, time_to_analyze=args['time_to_analyze']
-        )
-
-    currmax = max(ord_baseline)
-    final_decrease = 0
-    decreases = 0
-    curr_ind = 0
-    all_decreases = []
-    while curr_ind < len(ord_baseline):
-        final_decrease_baseline = curr_ind
-        for i, val in enumerate(ord_baseline[curr_ind:], curr_ind):
-            if val == currmax:
-                continue
-            else:
-                final_decrease_baseline = i
-                break
-        print(curr_ind)
-        print(len(ord_baseline))
-        curr_ind = final_decrease_baseline
-        if len(all_decreases) == 0:
-            all_decreases.append(final_decrease_baseline)
-            continue
-        if final_decrease_baseline != all_decreases[-1]:
-            all_decreases.append(final_decrease_baseline)
-        else:
-            break
-
-    curr_max = max(ord_baseline)
-    all_decreases = [0]
-    for i, val in enumerate(ord_baseline):
-        if val == curr_max:
-            continue
-        else:
-            curr_max = val
-            all_decreases.append(i)
-
-    for i, val in enumerate(all_decreases[:-1]):
-        baseline_time = x_range[all_decreases[i+1]]-x_range[val]
-        avg_baseline_battery_mw = abs(millijoules_to_milliwatts(
-            milliwatthours_to_millijoules((ord_baseline[val] - ord_baseline[all_decreases[i+1]])),
-            abs(baseline_time)
-        ))
-        print(avg_baseline_battery_mw)
-
-
-    print(all_decreases)
-    print("all_decreases")
-
-    currmin = ord_baseline[-1]
-    final_decrease = 0
-    for i, val in enumerate(ord_baseline[::-1]):
-        if val == currmin:
-            continue
-        else:
-            final_decrease = i
-            if final_decrease > len(ord_baseline):
-                final_decrease = len(ord_baseline)
-            else:
-                final_decrease_baseline = len(ord_baseline) - final_decrease
-            break
-
-    # Determine test boundaries
-    found_decrease = 0
-    first_good_test = 0
-    for i, val in enumerate(deltas_test):
-        if val <= 0:
-            continue
-        else:
-            first_good_test = i-1
-            if first_good_test < 0 or first_good_test >= len(deltas_test):
-                first_good_test = 0
-            break
-
-    if args['time_to_analyze']:
-        deltas_test = cut_time_out(
-            deltas_test, start_ind=first_good_test, time_to_analyze=args['time_to_analyze']
-        )
-        ord_test = cut_time_out(
-            ord_test, start_ind=first_good_test, time_to_analyze=args['time_to_analyze']
-        )
-    
-    currmin = ord_test[-1]
-    final_decrease_test = 0
-    for i, val in enumerate(ord_test[::-1]):
-        if val == currmin:
-            continue
-        else:
-            final_decrease = i
-            if final_decrease > len(ord_test):
-                final_decrease = len(ord_test)
-            else:
-                final_decrease_test = len(ord_test) - final_decrease
-            break
+    # Determine the baseline and test boundaries, the test
+    # starts on the sample before its first drain
+    baseline_battery = analyze_battery(
+        ord_baseline, smooth=args['smooth_battery'], time_to_analyze=args['time_to_analyze'],
+        interval=DIST_BETWEEN_SAMPLES
+    )
+    test_battery = analyze_battery(
+        ord_test, start_offset=-1, time_to_analyze=args['time_to_analyze'],
+        interval=DIST_BETWEEN_SAMPLES
+    )
 
+    ord_baseline = baseline_battery['capacity']
+    deltas_base = baseline_battery['deltas']
+    first_good_base = baseline_battery['first_drain']
+    final_decrease_baseline = baseline_battery['final_drain']
 
-    baseline_time = x_range[final_decrease_baseline]-x_range[first_good_base+1]
-    avg_baseline_battery_mw = 0
-    if baseline_time > 0:
-        avg_baseline_battery_mw = abs(millijoules_to_milliwatts(
-            milliwatthours_to_millijoules((ord_baseline[first_good_base+1] - ord_baseline[final_decrease_baseline])),
-            abs(baseline_time)
-        ))
+    ord_test = test_battery['capacity']
+    first_good_test = test_battery['first_drain']
+    final_decrease_test = test_battery['final_drain']
 
-    test_time = x_range[final_decrease_test]-x_range[first_good_test]
-    avg_test_battery_mw = 0
-    if test_time > 0:
-        avg_test_battery_mw = abs(millijoules_to_milliwatts(
-            milliwatthours_to_millijoules((ord_test[first_good_test] - ord_test[final_decrease_test])),
-            abs(test_time)
-        ))
+    avg_baseline_battery_mw = get_drain_rate(
+        ord_baseline, first_good_base+1, final_decrease_baseline, interval=DIST_BETWEEN_SAMPLES
+    )
+    avg_test_battery_mw = get_drain_rate(
+        ord_test, first_good_test, final_decrease_test, interval=DIST_BETWEEN_SAMPLES
+    )
 
-    avg_baseline_battery_mwh = (ord_baseline[first_good_base] - ord_baseline[-1])
-    avg_test_battery_mwh = (ord_test[first_good_test] - ord_test[-1])
+    avg_baseline_battery_mwh = float(ord_baseline[first_good_base] - ord_baseline[-1])
+    avg_test_battery_mwh = float(ord_test[first_good_test] - ord_test[-1])
 
     if args['time_to_analyze']:
         ord_baseline_pc = cut_time_out(ord_baseline_pc, start_ind=first_good_base, time_to_analyze=args['time_to_analyze'])
@@ -293,32 +188,24 @@ def compare_data(baselinedir, testdir, config, args):
         plt.show()
 
     # Conduct power usage analysis
-    ord_baseline = get_ordered_datalist_power(baselinedata)
-    ord_baseline = [r[1:] for r in ord_baseline]
+    ord_baseline = baselinedata
 
     if args['time_to_analyze']:
         ord_baseline = cut_time_out(ord_baseline, time_to_analyze=args['time_to_analyze'])
         args['baseline_time'] = args['time_to_analyze']
 
-    avg_baseline_consumption_mw = get_avg_consumption_rate(
-        ord_baseline, args['baseline_time'], milliwatthour=False, header=header[1:], consumption_from=args['consumption_from']
-    )
-    avg_baseline_consumption_mwh = get_avg_consumption_rate(
-        ord_baseline, args['baseline_time'], milliwatthour=True, header=header[1:], consumption_from=args['consumption_from']
+    avg_baseline_consumption_mw, avg_baseline_consumption_mwh = get_avg_consumption_rates(
+        ord_baseline, args['baseline_time'], consumption_from=args['consumption_from']
     )
 
-    ord_test = get_ordered_datalist_power(testdata)
-    ord_test = [r[1:] for r in ord_test]
+    ord_test = testdata
 
     if args['time_to_analyze']:
         ord_test = cut_time_out(ord_test, time_to_analyze=args['time_to_analyze'])
         args['test_time'] = args['time_to_analyze']
 
-    avg_test_consumption_mw = get_avg_consumption_rate(
-        ord_test, args['test_time'], milliwatthour=False, header=header[1:], consumption_from=args['consumption_from']
-    )
-    avg_test_consumption_mwh = get_avg_consumption_rate(
-        ord_test, args['test_time'], milliwatthour=True, header=header[1:], consumption_from=args['consumption_from']
+    avg_test_consumption_mw, avg_test_consumption_mwh = get_avg_consumption_rates(
+        ord_test, args['test_time'], consumption_from=args['consumption_from']
     )
     colors = [
         'black', 'silver', 'red', 'gold',
@@ -333,7 +220,7 @@ def compare_data(baselinedir, testdir, config, args):
 
         x_range = []
         ignores = []
-        for i, _ in enumerate(ord_baseline):
+        for i in range(len(ord_baseline)):
             x_range.append(DIST_BETWEEN_SAMPLES*i)
         for i, val in enumerate(ignores):
             if i == 0:
@@ -343,11 +230,11 @@ def compare_data(baselinedir, testdir, config, args):
         colormap = plt.cm.gnuplot
         ax1.set_color_cycle([colormap(i) for i in np.linspace(0, 1, number_of_plots)])
 
-        all_entries = [x for x in zip(*ord_baseline)]
+        all_entries = ord_baseline.values.T
 
         for i, row in enumerate(all_entries):
             if i in ignores: continue
-            plt.plot(x_range,[x/60 for x in row], label=header[i+1], color=colors[i])
+            plot_downsampled(ax1, x_range, row/60, label=header[i+1], color=colors[i])
         plt.title("Baseline Power (mW) over time (s)")
         plt.legend()
         plt.xlim(0,9500)
@@ -357,7 +244,7 @@ def compare_data(baselinedir, testdir, config, args):
 
         x_range = []
         ignores = []
-        for i, _ in enumerate(ord_test):
+        for i in range(len(ord_test)):
             x_range.append(DIST_BETWEEN_SAMPLES*i)
         for i, val in enumerate(ignores):
             if i == 0:
@@ -367,10 +254,10 @@ def compare_data(baselinedir, testdir, config, args):
         colormap = plt.cm.tab20
         ax1.set_color_cycle([colormap(i) for i in np.linspace(0, 1, number_of_plots)])
 
-        all_entries = [x for x in zip(*ord_test)]
+        all_entries = ord_test.values.T
         for i, row in enumerate(all_entries):
             if i in ignores: continue
-            plt.plot(x_range,[x/60 for x in row], label=header[i+1], color=colors[i])
+            plot_downsampled(ax1, x_range, row/60, label=header[i+1], color=colors[i])
         plt.title("Testing Power (mW) over time (s)")
         plt.legend()
         plt.show()
@@ -399,7 +286,7 @@ def compare_data(baselinedir, testdir, config, args):
         ]
     )
 
-    return {
+    results = {
         'power-base-mw': powerbasecsv,
         'power-test-mw': powertestcsv,
         'power-base-mwh': powerbasecsv_mwh,
@@ -407,6 +294,43 @@ def compare_data(baselinedir, testdir, config, args):
         'battery': batterycsv
     }
 
+    if args['window_size']:
+        results['power-windows-base'] = get_windows_csv(
+            baselinedata, baseline_reports, args['window_size'], step=args['window_step'],
+            consumption_from=args['consumption_from']
+        )
+        results['power-windows-test'] = get_windows_csv(
+            testdata, test_reports, args['window_size'], step=args['window_step'],
+            consumption_from=args['consumption_from']
+        )
+
+    if args['fit_battery_drain']:
+        fitheader = 'battery-baseline-fit-mw,battery-baseline-fit-low-mw,battery-baseline-fit-high-mw,' + \
+            'battery-testing-fit-mw,battery-testing-fit-low-mw,battery-testing-fit-high-mw'
+        fitvals = []
+        for fit in (baseline_battery['fit'], test_battery['fit']):
+            if fit is None:
+                fitvals.extend(['nan', 'nan', 'nan'])
+            else:
+                fitvals.extend([str(fit['drain_mw']), str(fit['low_mw']), str(fit['high_mw'])])
+        results['battery-fit'] = fitheader + '\n' + ','.join(fitvals)
+
+    return results
+
+
+def get_wpa_offset(srum_times, srum_data, wpadata, max_offset=None):
+    # Lines up the WPA CPU usage with the SRUMUTIL CPU energy
+    cpu_tables = [dset for dset in wpadata if 'CPU_Usage' in dset]
+    if not cpu_tables or 'CPU Energy Consumption' not in srum_data.header or len(srum_times) < 2:
+        return None
+
+    cpu_usage = wpadata[cpu_tables[0]]
+    return estimate_offset(
+        srum_times, srum_data.column('CPU Energy Consumption'),
+        cpu_usage['times'], np.asarray(cpu_usage['data']),
+        period=1, max_offset=max_offset, ref_width=DIST_BETWEEN_SAMPLES
+    )
+
 
 def compare_to_wpa(datadir, config, args):
     print("Getting SRUMUTIL power measurements...")
@@ -415,34 +339,59 @@ def compare_to_wpa(datadir, config, args):
         args['baseline_application'],
         args['exclude_baseline_apps'],
         config['baselinestarttime'] if 'baselinestarttime' in config else 600,
-        args['baseline_time']
+        args['baseline_time'],
+        incremental=args['incremental_ingest'],
+        jobs=args['jobs'],
+        use_cache=not args['no_cache'],
+        consumption_from=args['consumption_from']
     )
 
         # Conduct power usage analysis
-    ord_baseline = get_ordered_datalist_power(baselinedata)
-    ord_baseline = [r[1:] for r in ord_baseline]
+    ord_baseline = baselinedata
 
     if args['time_to_analyze']:
         ord_baseline = cut_time_out(ord_baseline, time_to_analyze=args['time_to_analyze'])
         args['baseline_time'] = args['time_to_analyze']
 
-    avg_baseline_consumption_mw = get_avg_consumption_rate(
-        ord_baseline, args['baseline_time'], milliwatthour=False, header=header[1:], consumption_from=args['consumption_from']
-    )
-    avg_baseline_consumption_mwh = get_avg_consumption_rate(
-        ord_baseline, args['baseline_time'], milliwatthour=True, header=header[1:], consumption_from=args['consumption_from']
+    avg_baseline_consumption_mw, avg_baseline_consumption_mwh = get_avg_consumption_rates(
+        ord_baseline, args['baseline_time'], consumption_from=args['consumption_from']
     )
 
-    all_entries = [x for x in zip(*ord_baseline)]
-    all_entries_mw = []
-    for i, row in enumerate(all_entries):
-        all_entries_mw = [x/60 for x in row]
+    all_entries_mw = ord_baseline.values/60
 
     # Open WPA files
     _, wpadata = get_wpa_data(
-        datadir, args['baseline_application'], args['exclude_baseline_apps'], args['baseline_time']
+        datadir, args['baseline_application'], args['exclude_baseline_apps'], args['baseline_time'],
+        jobs=args['jobs'], out_of_core=args['wpa_out_of_core'],
+        period=args['wpa_period'], method=args['wpa_resample']
     )
 
+    # Average the WPA tables into the minute buckets SRUMUTIL reports
+    # so both are on the same time index
+    wpa_names = sorted(wpadata)
+    srum_times = DIST_BETWEEN_SAMPLES*np.arange(len(ord_baseline))
+
+    # Without the wpr.exe markers the WPA and SRUMUTIL clocks can be off by
+    # a lot, estimate the offset from the CPU usage and correct the WPA times.
+    wpa_offset = 0
+    if not args['no_wpa_align']:
+        wpa_offset = get_wpa_offset(srum_times, ord_baseline, wpadata, max_offset=args['wpa_max_offset'])
+        if wpa_offset is None:
+            print("Unable to estimate the clock offset between the WPA and SRUMUTIL data.")
+            wpa_offset = 0
+        else:
+            print("Estimated clock offset between the WPA and SRUMUTIL data: %s seconds" % wpa_offset)
+            for dset in wpa_names:
+                wpadata[dset]['times'] = wpadata[dset]['times'] + wpa_offset
+
+    wpa_minutes = np.zeros((len(srum_times), 0))
+    if wpa_names:
+        wpa_minutes = align_to_index(
+            srum_times,
+            [(wpadata[dset]['times'], wpadata[dset]['data']) for dset in wpa_names],
+            method='mean'
+        )
+
     colors = [
         'black', 'silver', 'red', 'gold',
         'darkgreen', 'navy', 'm', 'darkmagenta',
@@ -456,7 +405,7 @@ def compare_to_wpa(datadir, config, args):
 
         x_range = []
         ignores = []
-        for i, _ in enumerate(ord_baseline):
+        for i in range(len(ord_baseline)):
             x_range.append(DIST_BETWEEN_SAMPLES*i)
         for i, val in enumerate(ignores):
             if i == 0:
@@ -466,18 +415,20 @@ def compare_to_wpa(datadir, config, args):
         colormap = plt.cm.gnuplot
         ax1.set_color_cycle([colormap(i) for i in np.linspace(0, 1, number_of_plots)])
 
-        all_entries = [x for x in zip(*ord_baseline)]
+        all_entries = ord_baseline.values.T
 
         # TODO: Plot power usage as bars
         for i, row in enumerate(all_entries):
             if i in ignores: continue
-            plt.plot(x_range,[x/60 for x in row], label=header[i+1], color=colors[i])
+            plot_downsampled(ax1, x_range, row/60, label=header[i+1], color=colors[i])
 
-        # TODO: Average 1 minute intervals and plot them as bars
         colors2 = ['blue', 'lightblue']
-        for i, dset in enumerate(wpadata):
-            print(dset)
-            plt.plot(wpadata[dset]['times'], wpadata[dset]['data'], label=dset, color=colors2[i])
+        for i, dset in enumerate(wpa_names):
+            plot_downsampled(ax1, wpadata[dset]['times'], wpadata[dset]['data'], label=dset, color=colors2[i])
+            plt.bar(
+                srum_times, wpa_minutes[:, i], width=DIST_BETWEEN_SAMPLES, align='edge',
+                alpha=0.3, label=dset + ' (1 minute average)', color=colors2[i]
+            )
 
         # TODO: Correlate bar plot values
 
@@ -486,4 +437,21 @@ def compare_to_wpa(datadir, config, args):
         plt.xlim(0,9500)
         plt.show()
 
-    return None
+    alignedheader = ','.join(
+        ['time'] +
+        ['power-baseline-' + i + '-mw' for i in header[1:]] +
+        ['wpa-' + dset for dset in wpa_names]
+    )
+    aligned = np.column_stack([srum_times, all_entries_mw, wpa_minutes])
+    alignedcsv = alignedheader + '\n' + '\n'.join(
+        ','.join(str(x) for x in row) for row in aligned.tolist()
+    )
+
+    powerbaseheader_mw = ','.join(['power-baseline-' + i + '-mw' for i in header[1:]])
+    powerbasecsv = powerbaseheader_mw + '\n' + ','.join([str(x) for x in avg_baseline_consumption_mw])
+
+    return {
+        'power-base-mw': powerbasecsv,
+        'wpa-aligned': alignedcsv,
+        'wpa-offset': 'wpa-offset-seconds\n' + str(wpa_offset)
+    }
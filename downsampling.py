@@ -0,0 +1,70 @@
+import numpy as np
+
+# Most points drawn for a single line, whatever the zoom level
+MAX_PLOT_POINTS = 4000
+
+
+def minmax_downsample(x, y, bucketsize):
+    # Keeps the smallest and largest samples of every `bucketsize`
+    # samples, in the order they appear, so peaks are never lost.
+    x = np.asarray(x)
+    y = np.asarray(y)
+    if len(y) <= bucketsize:
+        return x, y
+
+    # The last bucket is padded with its last value to fill it
+    starts = np.arange(0, len(y), bucketsize)
+    padded = np.concatenate((y, np.full(len(starts)*bucketsize - len(y), y[-1])))
+    buckets = padded.reshape(len(starts), bucketsize)
+
+    inds = np.sort(np.column_stack((
+        np.argmin(buckets, axis=1),
+        np.argmax(buckets, axis=1)
+    )), axis=1) + starts[:, np.newaxis]
+    inds = np.minimum(inds, len(y) - 1).ravel()
+    inds = inds[np.concatenate(([True], np.diff(inds) != 0))]
+    return x[inds], y[inds]
+
+
+class LODSeries(object):
+    '''
+    Level-of-detail pyramid of a series used for plotting. The first
+    level holds every sample and each of the next ones is a min/max
+    envelope of the previous one, `factor` times smaller, down to
+    `max_points` samples.
+    '''
+    def __init__(self, x, y, max_points=MAX_PLOT_POINTS, factor=4):
+        self.max_points = max_points
+        self.levels = [(np.asarray(x, dtype=np.float64), np.asarray(y, dtype=np.float64))]
+        while len(self.levels[-1][0]) > max_points:
+            level = minmax_downsample(*self.levels[-1], bucketsize=2*factor)
+            if len(level[0]) >= len(self.levels[-1][0]):
+                break
+            self.levels.append(level)
+
+    def get(self, xmin=None, xmax=None):
+        # Returns the finest level that has at most `max_points` samples
+        # between xmin and xmax (x values must be sorted). The samples
+        # just outside of the range are kept so the line reaches the edges.
+        for i, (x, y) in enumerate(self.levels):
+            lo = 0
+            hi = len(x)
+            if xmin is not None:
+                lo = max(np.searchsorted(x, xmin, side='left') - 1, 0)
+            if xmax is not None:
+                hi = np.searchsorted(x, xmax, side='right') + 1
+            if hi - lo <= self.max_points or i == len(self.levels) - 1:
+                return x[lo:hi], y[lo:hi]
+
+
+def plot_downsampled(ax, x, y, max_points=MAX_PLOT_POINTS, **kwargs):
+    # Plots a series from its pyramid, the line is redrawn from
+    # the matching level whenever the x limits change (i.e. zooming).
+    lod = LODSeries(x, y, max_points=max_points)
+    line, = ax.plot(*lod.get(), **kwargs)
+
+    def update(ax):
+        line.set_data(*lod.get(*ax.get_xlim()))
+
+    ax.callbacks.connect('xlim_changed', update)
+    return line
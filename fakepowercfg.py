@@ -0,0 +1,129 @@
+import argparse
+import math
+import os
+import shutil
+import sys
+import time
+import tempfile
+
+import batteryanalysis
+import batteryusageparser
+import windows_powerusage
+from windows_powerusage import DrainEstimator, WinPowerUsage
+
+# Stand-in for powercfg.exe, used to check the collector on machines
+# that don't have it. The battery drains by FAKE_DRAIN_MW (1500 mW by
+# default) and the capacity is reported in steps of CAPACITY_STEP mWh.
+FAKE_DRAIN_MW = float(os.environ.get('FAKE_DRAIN_MW', 1500))
+CAPACITY_STEP = 10
+FULL_CAPACITY = 10**15
+
+
+def fakeparser():
+    parser = argparse.ArgumentParser(
+        description='Checks that WinPowerUsage stops the test phase once the drain rate '
+                    'is precise enough, using this script as a stand-in for powercfg.exe.'
+    )
+
+    parser.add_argument('--tolerance', type=float, default=1000,
+                        help='Tolerance (in mW) given to WinPowerUsage (default is 1000).')
+
+    parser.add_argument('--drain', type=float, default=90000,
+                        help='Drain rate (in mW) of the fake battery, high enough to get '
+                             'a few capacity steps every second (default is 90000).')
+
+    parser.add_argument('--timeout', type=float, default=120,
+                        help='Longest time to wait for the test to stop, in seconds (default is 120).')
+
+    return parser
+
+
+def get_fake_capacity():
+    drained = FAKE_DRAIN_MW*time.time()/3600
+    return FULL_CAPACITY - int(drained/CAPACITY_STEP)*CAPACITY_STEP
+
+
+def write_fake_output(command, output):
+    if command == '/BATTERYREPORT':
+        with open(output, 'w') as f:
+            f.write('<div>Report generated by fakepowercfg.py</div>\n')
+            f.write('<td class="percent">50 %\n')
+            f.write('</td><td class="mw">{:,} mWh\n'.format(get_fake_capacity()))
+    elif command == '/SRUMUTIL':
+        with open(output, 'w') as f:
+            f.write('AppId, UserId, TimeStamp\n')
+
+
+def check_copies():
+    # windows_powerusage.py is copied on its own, so it has its own copies
+    # of the report patterns and of the drain fit. Make sure they still match.
+    same = True
+    for name in ('REPORT_LINE_PATTERN', 'PERCENT_PATTERN', 'CAPACITY_PATTERN'):
+        if getattr(windows_powerusage, name).pattern != getattr(batteryusageparser, name).pattern:
+            print("%s differs from the one in batteryusageparser.py" % name)
+            same = False
+    if windows_powerusage.T_CRITICAL_95 != batteryanalysis.T_CRITICAL_95:
+        print("T_CRITICAL_95 differs from the one in batteryanalysis.py")
+        same = False
+
+    # Capacity steps of an uneven drain, with enough of them to
+    # go through every part of the t table
+    for steps in (3, 12, 45, 150):
+        estimator = DrainEstimator(min_steps=3)
+        estimator.add(0, 50000)
+        times = [60*i + 7*(i % 3) for i in range(1, steps + 1)]
+        capacities = [50000 - CAPACITY_STEP*i for i in range(1, steps + 1)]
+        for sampletime, capacity in zip(times, capacities):
+            estimator.add(sampletime, capacity)
+
+        drain, margin = estimator.estimate()
+        fit = batteryanalysis.fit_drain_rate(times, capacities)
+        if not (math.isclose(drain, fit['drain_mw'], rel_tol=1e-6) and
+                math.isclose(margin, (fit['high_mw'] - fit['low_mw'])/2, rel_tol=1e-6)):
+            print("DrainEstimator differs from batteryanalysis.fit_drain_rate with %s steps" % steps)
+            same = False
+
+    return same
+
+
+def check_early_stop(args):
+    outputdir = tempfile.mkdtemp(prefix='fakepowercfg')
+    os.environ['FAKE_DRAIN_MW'] = str(args['drain'])
+
+    try:
+        powerusage = WinPowerUsage(
+            outputdir, outputdir, powercfg=[sys.executable, os.path.abspath(__file__)],
+            tolerance=args['tolerance'], poll_interval=1
+        )
+
+        starttime = time.time()
+        powerusage.test_start()
+        precise = powerusage.wait_until_precise(args['timeout'])
+        powerusage.stop()
+        powerusage.kill()
+        powerusage.runner.join()
+    finally:
+        shutil.rmtree(outputdir)
+
+    print("Test stopped early: %s (after %s seconds, expected drain rate %s mW)" % (
+        precise, round(time.time() - starttime), args['drain']
+    ))
+    return precise
+
+
+def main():
+    # Called by WinPowerUsage like powercfg.exe, e.g. `/BATTERYREPORT /OUTPUT <file>`
+    if len(sys.argv) > 1 and sys.argv[1].startswith('/'):
+        write_fake_output(sys.argv[1].upper(), sys.argv[-1])
+        return
+
+    parser = fakeparser()
+    args = parser.parse_args()
+    args = dict(vars(args))
+    if not check_copies():
+        sys.exit(1)
+    sys.exit(0 if check_early_stop(args) else 1)
+
+
+if __name__=="__main__":
+    main()
@@ -4,6 +4,7 @@ import time
 import json
 
 from comparisons import compare_data, compare_to_wpa
+from resampling import RESAMPLERS
 
 
 def analysisparser():
@@ -67,15 +68,65 @@ def analysisparser():
     parser.add_argument('--plot-battery', action='store_true', default=False,
                         help='Plots battery usage over time, drain rates, and the approximate linear drain rate.')
 
+    parser.add_argument('--fit-battery-drain', action='store_true', default=False,
+                        help='Also fits the battery drain rate over the capacity steps with least squares, '
+                             'and gives its 95%% confidence interval. This is precise on much shorter runs.')
+
+    parser.add_argument('--battery-history', action='store_true', default=False,
+                        help='Rebuild the battery capacity over time from the "Recent usage" history '
+                             'stored in the battery reports rather than using one value per report. '
+                             'Only a report at the start and end of each phase is needed.')
+
     parser.add_argument('--consumption-from', nargs='+', default=None,
                         help='Only calculates power consumption from these sources (must match values from SRUMUTIL csv header).')
 
+    parser.add_argument('--window-size', type=int, default=None,
+                        help='Also gives the average power and battery drain over sliding windows of '
+                             'this many seconds in each phase.')
+
+    parser.add_argument('--window-step', type=int, default=None,
+                        help='Seconds between the start of each window given with --window-size '
+                             '(default is the window size).')
+
+    parser.add_argument('--incremental-ingest', action='store_true', default=False,
+                        help='Only parse the rows of each SRUMUTIL snapshot that are newer than the '
+                             'previous snapshot, instead of re-parsing the full history every time.')
+
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of processes to use when parsing the data files, by default '
+                             'they are parsed one at a time.')
+
+    parser.add_argument('--no-cache', action='store_true', default=False,
+                        help='Always parse the raw data files instead of reusing the parsed data cached '
+                             'in the `.parsecache` folder of the data directories.')
+
     parser.add_argument('--compare', action='store_true', default=False,
                         help='Compares the baseline data to the test data (defined by the folder names).')
 
     parser.add_argument('--compare-to-wpa', action='store_true', default=False,
                         help='Compares the data type specified by --wpa-type, to the WPA data specified with this flag.')
 
+    parser.add_argument('--wpa-out-of-core', action='store_true', default=False,
+                        help='Memory-map the WPA tables and process them in chunks, for tables '
+                             'that are too large to fit in memory.')
+
+    parser.add_argument('--wpa-period', type=float, default=1/60,
+                        help='Period, in seconds, of the time index the WPA tables are resampled '
+                             'onto (default is 1/60).')
+
+    parser.add_argument('--wpa-resample', type=str, default='linear', choices=sorted(RESAMPLERS),
+                        help='How the WPA tables are resampled onto that time index, either by linear '
+                             'interpolation (default), the mean or sum of each bucket, or by holding the '
+                             'last value.')
+
+    parser.add_argument('--no-wpa-align', action='store_true', default=False,
+                        help='Do not estimate and correct the clock offset between the WPA and SRUMUTIL '
+                             'data using the cross-correlation of their CPU usage.')
+
+    parser.add_argument('--wpa-max-offset', type=float, default=300,
+                        help='Largest clock offset, in seconds, that can be found between the WPA and '
+                             'SRUMUTIL data (default is 300).')
+
     parser.add_argument('--wpa-type', type=str, default='baseline',
                         help='The data type (either baseline, by default, or test) to use in comparison with WPA data.')
 
@@ -101,6 +152,10 @@ def display_results(results):
             str(results['power-base-mwh'].split('\n')[-1].split(',')[-1])
         )
     )
+    if 'battery-fit' in results:
+        print("Battery (fitted): %s mW, 95%% interval [%s, %s] mW" % tuple(
+            results['battery-fit'].split('\n')[-1].split(',')[0:3]
+        ))
     print()
 
     print("Summary of test results")
@@ -115,6 +170,10 @@ def display_results(results):
             str(results['power-test-mwh'].split('\n')[-1].split(',')[-1])
         )
     )
+    if 'battery-fit' in results:
+        print("Battery (fitted): %s mW, 95%% interval [%s, %s] mW" % tuple(
+            results['battery-fit'].split('\n')[-1].split(',')[3:6]
+        ))
 
     return
 
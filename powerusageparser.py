@@ -1,90 +1,198 @@
+import os
 import re
 import time
 import datetime
+import hashlib
+import functools
+import numpy as np
 
 from utils import (
-    pattern_find,
+    PatternMatcher,
     get_paths_from_dir,
-    millijoules_to_milliwatts
+    millijoules_to_milliwatts,
+    parallel_map
 )
+from snapshotcache import SnapshotCache
+from srumseries import SRUMSeries
 
+SRUM_TIMESTAMP_FORMAT = "%Y-%m-%d:%H:%M:%S"
 
-def open_srumutil_report(fname, application, excluded_apps):
-    with open(fname, 'r') as f:
-        rawdata = f.readlines()
-        data = []
-        for row in rawdata:
-            row = row.split('\n')[0]
-            data.append(row.split(','))
+# Bump whenever the parsed output changes to invalidate cached snapshots
+SRUM_PARSER_VERSION = 3
 
-    header = data[0]
-    data = data[1:]
 
-    finaltime = int(time.mktime(
-        datetime.datetime.strptime(data[-1][2].lstrip(' ').split('.')[0], "%Y-%m-%d:%H:%M:%S").timetuple()
+@functools.lru_cache(maxsize=2**16)
+def _convert_srum_timestamp(tstamp):
+    return int(time.mktime(
+        datetime.datetime.strptime(tstamp, SRUM_TIMESTAMP_FORMAT).timetuple()
     ))
 
-    # There's a lot of data - filter as soon as possible
-    new_data = []
-    for row in data:
-        i = 0
-        found = False
-        while not found:
-            try:
-                tstamp = row[i].lstrip(' ').split('.')[0]
-                utc_tstamp = int(time.mktime(
-                    datetime.datetime.strptime(tstamp, "%Y-%m-%d:%H:%M:%S").timetuple()
-                ))
-                found = True
-            except:
-                i += 1
-                continue
 
-        # Don't gather things from before this files run
-        # (specified by starttime in config.json).
-        if utc_tstamp < finaltime:
+def srum_timestamp_to_utc(tstamp):
+    # Rows in a report share a small set of timestamps (sub-second
+    # digits aside) so the conversions are cached per distinct string.
+    return _convert_srum_timestamp(tstamp.lstrip(' ').split('.')[0])
+
+
+def find_timestamp_column(header, row=None):
+    for i, name in enumerate(header):
+        if name.strip(' ').lower() == 'timestamp':
+            return i
+
+    # Unknown header, use the first column that parses as a timestamp
+    for i, val in enumerate(row or []):
+        try:
+            srum_timestamp_to_utc(val)
+            return i
+        except ValueError:
             continue
-        # Skip requested apps
-        if excluded_apps != None:
-            if pattern_find(row[0], excluded_apps):
+    return None
+
+
+def iter_lines_reversed(f, blocksize=2**16):
+    # Yields the lines of a binary file from the last one to the
+    # second one, the first line (the header) is never returned.
+    f.seek(0, os.SEEK_END)
+    pos = f.tell()
+    remainder = b''
+    while pos > 0:
+        step = min(blocksize, pos)
+        pos -= step
+        f.seek(pos)
+        lines = (f.read(step) + remainder).split(b'\n')
+        remainder = lines[0]
+        for line in reversed(lines[1:]):
+            line = line.rstrip(b'\r')
+            if line:
+                yield line.decode('utf-8', 'replace')
+
+
+def get_srumutil_finaltime(fname, tscol=None):
+    # The last row holds the most recent timestamp, read it from the
+    # end of the file so we never have to go through the whole report.
+    with open(fname, 'rb') as f:
+        if tscol is None:
+            header = f.readline().decode('utf-8', 'replace').rstrip('\r\n').split(',')
+            tscol = find_timestamp_column(header)
+            if tscol is None:
+                tscol = 2
+        for line in iter_lines_reversed(f, blocksize=4096):
+            return srum_timestamp_to_utc(line.split(',')[tscol])
+
+
+def keep_srumutil_row(appname, app_matcher, excluded_matcher):
+    # Skip requested apps
+    if excluded_matcher.find(appname):
+        return False
+    # Get application requested
+    return app_matcher.matches(appname)
+
+
+def iter_srumutil_report(fname, app_matcher, excluded_matcher, finaltime):
+    # There's a lot of data - filter as soon as possible, one
+    # line at a time, and only yield the rows we want to keep.
+    with open(fname, 'r') as f:
+        header = f.readline().split('\n')[0].split(',')
+        i = None
+        for line in f:
+            row = line.split('\n')[0].split(',')
+            if i is None:
+                # Only look for the timestamp column once per file
+                i = find_timestamp_column(header, row)
+            utc_tstamp = srum_timestamp_to_utc(row[i])
+
+            # Don't gather things from before this files run
+            # (specified by starttime in config.json).
+            if utc_tstamp < finaltime:
                 continue
-        # Get application requested, replace timestamp at the same time
-        if pattern_find(row[0], application) or '' in application:
-            newval = row[:2]
-            newval.append(utc_tstamp)
-            newval.extend(row[i:])
-            new_data.append(newval)
-
-    return header, new_data, finaltime
-
-
-def merge_srum_rows(datadict):
-    merged_dict = {}
-    seen = {}
-    for time, data in datadict.items():
-        merged_dict[time] = [0 for _ in range(len(data['data'][0]))]
-        seen[time] = []
-        for row in data['data']:
-            if row in seen[time]: continue
-            seen[time].append(row)
-            merged_dict[time] = [
-                merged_dict[time][i] + int(val)
-                for i, val in enumerate(row)
-            ]
-    return merged_dict
-
-
-def convert_data_to_milliwatts(datadict, total_time):
-    new_data = {}
-    for time, data in datadict.items():
-        new_data[time] = []
-        for val in data:
-            new_data[time].append(
-                millijoules_to_milliwatts(
-                    val, total_time
-                )
-            )
-    return new_data
+            if keep_srumutil_row(row[0], app_matcher, excluded_matcher):
+                # Replace timestamp at the same time
+                newval = row[:2]
+                newval.append(utc_tstamp)
+                newval.extend(row[i:])
+                yield newval
+
+
+def iter_srumutil_report_tail(fname, app_matcher, excluded_matcher, cutoff):
+    # Reports are written in chronological order, so reading from the
+    # end lets us stop at the first row older than `cutoff` without
+    # parsing the history that was already ingested from earlier files.
+    with open(fname, 'rb') as f:
+        header = f.readline().decode('utf-8', 'replace').rstrip('\r\n').split(',')
+        i = None
+        for line in iter_lines_reversed(f):
+            row = line.split(',')
+            if i is None:
+                i = find_timestamp_column(header, row)
+            utc_tstamp = srum_timestamp_to_utc(row[i])
+
+            if utc_tstamp < cutoff:
+                break
+            if keep_srumutil_row(row[0], app_matcher, excluded_matcher):
+                newval = row[:2]
+                newval.append(utc_tstamp)
+                newval.extend(row[i:])
+                yield newval
+
+
+def get_snapshot_time(fname):
+    # Snapshots are named after the time they were taken, i.e. srumutil<time>.csv
+    found = re.findall(r'\d+', os.path.basename(fname))
+    return int(found[-1]) if found else 0
+
+
+def open_srumutil_report(fname, application, excluded_apps, stream=False, watermark=None):
+    # With `stream` set, the rows are returned as a generator so
+    # that a report never has to be held in memory all at once.
+    # Given a `watermark`, only rows newer than it are parsed.
+    with open(fname, 'r') as f:
+        header = f.readline().split('\n')[0].split(',')
+
+    # The application lists are compiled once for the whole file
+    app_matcher = PatternMatcher(application)
+    excluded_matcher = PatternMatcher(excluded_apps or [])
+
+    finaltime = get_srumutil_finaltime(fname)
+    if finaltime is None:
+        # Only a header, there are no rows to read
+        rows = iter(())
+    elif watermark is None:
+        rows = iter_srumutil_report(fname, app_matcher, excluded_matcher, finaltime)
+    else:
+        rows = iter_srumutil_report_tail(
+            fname, app_matcher, excluded_matcher, max(finaltime, watermark + 1)
+        )
+    if not stream:
+        rows = list(rows)
+
+    return header, rows, finaltime
+
+
+def get_srum_row_key(energy):
+    # Rows are de-duplicated on every energy column, even the ones that
+    # aren't parsed, so they are keyed on a hash of the raw values. The
+    # hash has to be the same in every worker, unlike the builtin one.
+    raw = ','.join(x.lstrip(' ') for x in energy).encode('utf-8')
+    return int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), 'little', signed=True)
+
+
+def merge_srum_rows(datadict, header):
+    # Rows are stored in a dict keyed on their row key, so duplicates
+    # are dropped by hashing and each bucket is summed in a single pass.
+    times = sorted(datadict.keys(), key=int)
+    merged = np.zeros((len(times), len(header)), dtype=np.float64)
+    for i, time in enumerate(times):
+        rows = np.array(list(datadict[time]['data'].values()), dtype=np.int64)
+        merged[i] = rows.reshape(len(rows), len(header)).sum(axis=0)
+    return SRUMSeries([int(t) for t in times], merged, header)
+
+
+def convert_data_to_milliwatts(series, total_time):
+    return SRUMSeries(
+        series.times,
+        millijoules_to_milliwatts(series.values, total_time),
+        series.header
+    )
 
 
 def get_srumutil_files(datadir):
@@ -92,43 +200,121 @@ def get_srumutil_files(datadir):
     return files
 
 
-def fill_holes(merged_data, mintime=None, maxtime=None):
-    newdata = {}
+def fill_holes(series, mintime=None, maxtime=None, interval=60):
+    # Build the full grid of samples from mintime to maxtime and
+    # scatter the observed samples into it, missing ones stay at 0.
+    # A new series is returned, the given one is left untouched.
+    if not mintime:
+        mintime = int(series.times.min())
     if not maxtime:
-        maxtime = max(list([int(x) for x in merged_data.keys()]))
-    else:
-        if str(maxtime) not in merged_data:
-            keys = list(merged_data.keys())
-            merged_data[str(maxtime)] = [0 for _ in merged_data[keys[0]]]
-    if mintime:
-        if str(mintime) not in merged_data:
-            keys = list(merged_data.keys())
-            merged_data[str(mintime)] = [0 for _ in merged_data[keys[0]]]
-
-    for key, val in merged_data.items():
-        newdata[str(key)] = val
-        newkey = int(key) + 60
-        if str(newkey) in merged_data:
-            continue
-        if newkey > maxtime:
-            continue
-        while str(newkey) not in merged_data and newkey < maxtime:
-            newdata[str(newkey)] = [0 for _ in val]
-            newkey = newkey + 60
+        maxtime = int(series.times.max())
+
+    count = int(np.rint((maxtime - mintime)/interval)) + 1
+    times = mintime + interval*np.arange(count, dtype=np.int64)
+
+    slots = np.rint((series.times - mintime)/interval).astype(np.int64)
+    inside = (slots >= 0) & (slots < count)
+
+    values = np.zeros((count, len(series.header)), dtype=np.float64)
+    np.add.at(values, slots[inside], series.values[inside])
+    return SRUMSeries(times, values, series.header)
 
-    return newdata
 
+def get_energy_columns(header, consumption_from=None):
+    # Energy measurements start at the 13th column of the report, only
+    # the ones listed in `consumption_from` (or all of them) are parsed.
+    names = [x.lstrip(' ') for x in header[12:]]
+    return [
+        i for i, name in enumerate(names)
+        if not consumption_from or name in consumption_from
+    ]
 
-def open_srumutil_data(testdir, application, excluded_apps, teststarttim, dist_between_samples):
+
+def parse_srumutil_snapshot(item, application, excluded_apps, consumption_from=None, cache=None):
+    # Parses a single snapshot given as (file, watermark), this is what
+    # gets sent to the workers when parsing in parallel. Rows are given
+    # as (timestamp, key, values) with only the `consumption_from` values.
+    file, watermark = item
+    params = (application, excluded_apps, watermark)
+    if cache is not None:
+        arrays = cache.load(file, params, SRUM_PARSER_VERSION)
+        if arrays is not None:
+            header = arrays['header'].tolist()
+            values = arrays['values'][:, get_energy_columns(header, consumption_from)]
+            rows = list(zip(
+                arrays['times'].tolist(),
+                arrays['keys'].tolist(),
+                [tuple(row) for row in values.tolist()]
+            ))
+            return file, header, int(arrays['finaltime']), rows
+
+    header, data, finaltime = open_srumutil_report(
+        file, application, excluded_apps, stream=True, watermark=watermark
+    )
+
+    # Timestamps are inserted before the columns of the report so the
+    # energy columns start at index 13 in these rows. Cached entries are
+    # shared by every --consumption-from, so they hold all the columns.
+    projection = get_energy_columns(header, consumption_from)
+    parsed = get_energy_columns(header) if cache is not None else projection
+    rows = [
+        (row[2], get_srum_row_key(row[13:]), tuple(int(row[13 + i].lstrip(' ')) for i in parsed))
+        for row in data
+    ]
+
+    if cache is not None and finaltime is not None:
+        values = np.zeros((0, len(parsed)), dtype=np.int64)
+        if rows:
+            values = np.asarray([r for _, _, r in rows], dtype=np.int64)
+        cache.store(file, params, SRUM_PARSER_VERSION, {
+            'header': np.asarray(header),
+            'finaltime': np.asarray(finaltime, dtype=np.int64),
+            'times': np.asarray([t for t, _, _ in rows], dtype=np.int64),
+            'keys': np.asarray([k for _, k, _ in rows], dtype=np.int64),
+            'values': values
+        })
+
+    if cache is not None:
+        rows = [(t, k, tuple(r[i] for i in projection)) for t, k, r in rows]
+    return file, header, finaltime, rows
+
+
+def open_srumutil_data(testdir, application, excluded_apps, teststarttim, dist_between_samples,
+                       incremental=False, jobs=None, use_cache=False, consumption_from=None):
     files = get_srumutil_files(testdir)
 
+    # Incremental ingestion keeps a watermark of the newest timestamp
+    # seen so far, so each snapshot only contributes its new rows.
+    watermarks = [None for _ in files]
+    if incremental:
+        files = sorted(files, key=lambda f: (get_snapshot_time(f), f))
+        watermark = 0
+        for i, file in enumerate(files):
+            watermarks[i] = watermark
+            finaltime = get_srumutil_finaltime(file)
+            if finaltime is not None:
+                watermark = max(watermark, finaltime)
+
+    cache = SnapshotCache(testdir) if use_cache else None
+    parse = functools.partial(
+        parse_srumutil_snapshot, application=application, excluded_apps=excluded_apps,
+        consumption_from=consumption_from, cache=cache
+    )
+
     mintime = 0
     maxtime = 0
     currtime = 0
     currdata = {}
-    for i, file in enumerate(files):
-        header, data, currtime = open_srumutil_report(file, application, excluded_apps)
-        if i == 0:
+    results = parallel_map(parse, list(zip(files, watermarks)), jobs=jobs)
+    found = 0
+    for file, header, currtime, data in results:
+        if currtime is None:
+            # Snapshots with only a header have nothing to merge
+            print("Skipping empty SRUMUTIL snapshot %s" % file)
+            continue
+
+        found += 1
+        if found == 1:
             mintime = currtime
             maxtime = currtime
         elif currtime < mintime:
@@ -136,24 +322,27 @@ def open_srumutil_data(testdir, application, excluded_apps, teststarttim, dist_b
         elif currtime > maxtime:
             maxtime = currtime
 
-        for row in data:
-            if str(row[2]) not in currdata:
-                currdata[str(row[2])] = {
-                    'data': [],
+        for utc_tstamp, key, row in data:
+            if str(utc_tstamp) not in currdata:
+                currdata[str(utc_tstamp)] = {
+                    'data': {},
                     'file': file
                 }
-            if currdata[str(row[2])]['file'] != file:
+            if currdata[str(utc_tstamp)]['file'] != file:
                 continue
-            currdata[str(row[2])]['data'].append([int(x.lstrip(' ')) for x in row[13:]])
+            currdata[str(utc_tstamp)]['data'][key] = row
+
+    if cache is not None:
+        cache.evict()
 
     print("Total datapoints found: %s" % len(list(currdata.keys())))
 
+    columns = get_energy_columns(header, consumption_from)
+    header = [header[12 + i].lstrip(' ') for i in columns]
     if len(list(currdata.keys())) == 0:
-        return header, currdata
+        return ['timestamp'] + header, SRUMSeries.empty(header)
 
-    header = ['timestamp'] + [x.lstrip(' ') for x in header[12:]]
-    merged_data = merge_srum_rows(currdata)
+    merged_data = merge_srum_rows(currdata, header)
     filled_data = fill_holes(merged_data, mintime=mintime, maxtime=maxtime)
 
-    return header, filled_data
-
+    return ['timestamp'] + header, filled_data
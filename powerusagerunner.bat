@@ -21,6 +21,9 @@ set MAXTESTTIME=%2
 :: If testing on AC, it must be specified as the third argument
 set ACPOWER=%3
 
+:: If DRAIN_TOLERANCE is set (in mW), the test stops as soon as the
+:: confidence interval of the battery drain rate is within it.
+
 cd %OUTPUT_DIR%
 FOR /F %%I IN ('getUTime.bat') DO SET CURRTIME=%%I
 
@@ -93,7 +96,14 @@ powercfg.exe /srumutil /csv /output "srumutil%CURRTIME%.csv"
 
 set /a "TESTCOUNT=%TESTCOUNT%+%TESTINTERVAL%"
 
+if defined DRAIN_TOLERANCE (
+	python.exe %TOOL_DIR%/checkdrain.py --test-dir %TESTINGDIR% --tolerance %DRAIN_TOLERANCE%
+	if not errorlevel 1 goto testdone
+)
+
 if %TESTCOUNT% LSS %MAXTESTTIME% goto testloop
+
+:testdone
 set TESTENDTIME=%CURRTIME%
 
 cd %USAGERUNDIR%
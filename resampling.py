@@ -0,0 +1,92 @@
+import numpy as np
+
+
+def _as_columns(values):
+    values = np.asarray(values, dtype=np.float64)
+    if values.ndim == 1:
+        return values[:, np.newaxis]
+    return values
+
+
+def _bucket_indices(times, grid, period):
+    # Bucket i holds the samples in [grid[i], grid[i] + period)
+    inds = np.floor((np.asarray(times) - grid[0])/period).astype(np.int64)
+    inside = (inds >= 0) & (inds < len(grid))
+    return inds, inside
+
+
+def resample_linear(times, values, grid, period):
+    values = _as_columns(values)
+    return np.column_stack([
+        np.interp(grid, times, values[:, i]) for i in range(values.shape[1])
+    ])
+
+
+def resample_sum(times, values, grid, period):
+    # Samples that aren't finite (i.e. the empty buckets of
+    # an earlier mean) are skipped
+    values = _as_columns(values)
+    inds, inside = _bucket_indices(times, grid, period)
+    values = values[inside]
+    sums = np.zeros((len(grid), values.shape[1]))
+    np.add.at(sums, inds[inside], np.where(np.isfinite(values), values, 0))
+    return sums
+
+
+def resample_mean(times, values, grid, period):
+    # Only finite samples are counted, buckets without
+    # any of them are left as NaN
+    values = _as_columns(values)
+    inds, inside = _bucket_indices(times, grid, period)
+    counts = np.zeros((len(grid), values.shape[1]))
+    np.add.at(counts, inds[inside], np.isfinite(values[inside]))
+    sums = resample_sum(times, values, grid, period)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return sums/counts
+
+
+def resample_last(times, values, grid, period):
+    # Hold the last value seen at, or before, each point of the grid
+    values = _as_columns(values)
+    inds = np.searchsorted(times, grid, side='right') - 1
+    return values[np.clip(inds, 0, len(times) - 1)]
+
+
+RESAMPLERS = {
+    'linear': resample_linear,
+    'mean': resample_mean,
+    'sum': resample_sum,
+    'last': resample_last
+}
+
+
+def register_resampler(name, resampler):
+    RESAMPLERS[name] = resampler
+
+
+def make_time_index(starttime, endtime, period):
+    return np.arange(starttime, endtime, period)
+
+
+def resample(times, values, grid, method='linear'):
+    # Returns an array with one row per point in `grid`, and
+    # a column per column in `values` (or a 1-D array for 1-D input)
+    if method not in RESAMPLERS:
+        raise ValueError("Unknown resampling method %s, expected one of: %s" % (
+            method, ', '.join(sorted(RESAMPLERS))
+        ))
+
+    period = grid[1] - grid[0] if len(grid) > 1 else 1
+    resampled = RESAMPLERS[method](np.asarray(times, dtype=np.float64), values, grid, period)
+    if np.ndim(values) == 1:
+        return resampled[:, 0]
+    return resampled
+
+
+def align_to_index(grid, series, method='linear'):
+    # Brings every (times, values) pair onto the same time index and
+    # returns them side by side as the columns of a single array.
+    return np.column_stack([
+        resample(times, values, grid, method=method)
+        for times, values in series
+    ])
@@ -0,0 +1,96 @@
+import os
+import time
+import hashlib
+import numpy as np
+
+CACHE_DIRNAME = '.parsecache'
+MAX_CACHE_ENTRIES = 4096
+
+
+def _hash(value):
+    return hashlib.sha1(repr(value).encode('utf-8')).hexdigest()[:20]
+
+
+class SnapshotCache(object):
+    '''
+    On-disk cache of parsed data files, stored as `.npz` files in a
+    `.parsecache` folder of the data directory. Entries are keyed on the
+    path, size, and mtime of the raw file along with the parser version,
+    parameters, and local time zone, so a modified file or parser is
+    parsed again.
+    '''
+    def __init__(self, datadir, max_entries=MAX_CACHE_ENTRIES):
+        self.cachedir = os.path.join(datadir, CACHE_DIRNAME)
+        self.max_entries = max_entries
+
+    def _entry_prefix(self, path, params):
+        return _hash(os.path.abspath(path)) + '-' + _hash(params) + '-'
+
+    def _entry_path(self, path, params, version):
+        # Timestamps are parsed as local times, so entries
+        # only hold for the time zone they were parsed in
+        stat = os.stat(path)
+        fingerprint = _hash((
+            stat.st_size, stat.st_mtime_ns, version,
+            time.timezone, time.altzone, time.tzname
+        ))
+        return os.path.join(self.cachedir, self._entry_prefix(path, params) + fingerprint + '.npz')
+
+    def load(self, path, params, version):
+        entry = self._entry_path(path, params, version)
+        if not os.path.exists(entry):
+            return None
+
+        try:
+            with np.load(entry) as npz:
+                arrays = {key: npz[key] for key in npz.files}
+        except (OSError, ValueError):
+            return None
+
+        # Mark the entry as recently used for eviction, it
+        # isn't needed to use the entry (i.e. read-only folders)
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return arrays
+
+    def store(self, path, params, version, arrays):
+        entry = self._entry_path(path, params, version)
+        try:
+            if not os.path.exists(self.cachedir):
+                os.makedirs(self.cachedir, exist_ok=True)
+
+            # Entries for an older version of this file, or from an
+            # older parser, are stale now
+            prefix = self._entry_prefix(path, params)
+            for cached in os.listdir(self.cachedir):
+                if cached.startswith(prefix) and cached != os.path.basename(entry):
+                    os.remove(os.path.join(self.cachedir, cached))
+
+            tmpentry = entry + '.%s.tmp' % os.getpid()
+            with open(tmpentry, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmpentry, entry)
+        except OSError as e:
+            print("Unable to cache parsed data for %s: %s" % (path, str(e)))
+
+    def evict(self):
+        # Only keep the most recently used entries
+        if not os.path.exists(self.cachedir):
+            return
+
+        entries = [
+            os.path.join(self.cachedir, f)
+            for f in os.listdir(self.cachedir)
+            if f.endswith('.npz')
+        ]
+        if len(entries) <= self.max_entries:
+            return
+
+        entries.sort(key=lambda f: os.stat(f).st_mtime)
+        for entry in entries[:len(entries) - self.max_entries]:
+            try:
+                os.remove(entry)
+            except OSError:
+                pass
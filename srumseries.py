@@ -0,0 +1,42 @@
+import numpy as np
+
+
+class SRUMSeries(object):
+    '''
+    Columnar storage for parsed SRUMUTIL data. Holds the
+    timestamps of each sample, a 2-D array with one column per
+    energy measurement, and the header naming those columns.
+    '''
+    __slots__ = ('times', 'values', 'header')
+
+    def __init__(self, times, values, header):
+        self.header = list(header)
+        self.times = np.asarray(times, dtype=np.int64)
+        self.values = np.asarray(values, dtype=np.float64).reshape(
+            len(self.times), len(self.header)
+        )
+
+    def __len__(self):
+        return len(self.times)
+
+    def __getitem__(self, key):
+        # Slices share the underlying arrays instead of copying them
+        if isinstance(key, slice):
+            return SRUMSeries(self.times[key], self.values[key], self.header)
+        return self.values[key]
+
+    def column_mask(self, names=None):
+        if not names:
+            return np.ones(len(self.header), dtype=bool)
+        return np.asarray([name in names for name in self.header], dtype=bool)
+
+    def column(self, name):
+        return self.values[:, self.header.index(name)]
+
+    @classmethod
+    def empty(cls, header):
+        return cls(
+            np.zeros(0, dtype=np.int64),
+            np.zeros((0, len(header)), dtype=np.float64),
+            header
+        )
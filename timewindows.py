@@ -0,0 +1,94 @@
+import numpy as np
+
+from batteryusageparser import get_creationtime_seconds
+from utils import (
+    milliwatthours_to_millijoules,
+    millijoules_to_milliwatts
+)
+
+
+def sliding_windows(starttime, endtime, length, step=None):
+    # Start and end times of every window of `length` seconds,
+    # `step` seconds apart (back to back by default), that fits
+    # between starttime and endtime.
+    starts = np.arange(starttime, endtime - length + 1, step or length)
+    return starts, starts + length
+
+
+class EnergyIndex(object):
+    '''
+    Cumulative sums of each column of a SRUMSeries, so the energy
+    used between any two times is found with two binary searches.
+    A window from t0 to t1 holds the samples taken at t0 <= t < t1,
+    and t0 and t1 can also be arrays to query many windows at once.
+    '''
+    def __init__(self, series):
+        self.series = series
+        self.times = series.times
+        self.cumsum = np.concatenate((
+            np.zeros((1, len(series.header))),
+            np.cumsum(series.values, axis=0)
+        ))
+
+    def energy(self, t0, t1, columns=None):
+        # Energy (in mJ) used by the given columns
+        lo = np.searchsorted(self.times, t0, side='left')
+        hi = np.searchsorted(self.times, t1, side='left')
+        return (self.cumsum[hi] - self.cumsum[lo])[..., self.series.column_mask(columns)]
+
+    def energy_mwh(self, t0, t1, columns=None):
+        return self.energy(t0, t1, columns=columns)/3600
+
+    def average_power(self, t0, t1, columns=None):
+        # Average power (in mW) of the given columns
+        duration = np.asarray(t1, dtype=np.float64) - np.asarray(t0, dtype=np.float64)
+        return millijoules_to_milliwatts(
+            self.energy(t0, t1, columns=columns),
+            duration[..., np.newaxis]
+        )
+
+
+class BatteryIndex(object):
+    '''
+    Battery capacities over time, the drain between any two times is
+    the difference of the last capacities reported at (or before) them.
+    Times outside of the reports give NaN rather than a guess.
+    '''
+    def __init__(self, times, capacities):
+        order = np.argsort(times, kind='stable')
+        self.times = np.asarray(times)[order]
+        self.capacities = np.asarray(capacities, dtype=np.float64)[order]
+
+    @classmethod
+    def from_reports(cls, reports):
+        # Builds the index from the output of open_battery_reports
+        times = [get_creationtime_seconds(int(key)) for key in reports]
+        return cls(times, [reports[key][1] for key in reports])
+
+    def capacity(self, t):
+        # The capacity is unknown (NaN) outside of the reports
+        t = np.asarray(t)
+        if len(self.times) == 0:
+            return np.full(t.shape, np.nan)
+
+        inds = np.clip(np.searchsorted(self.times, t, side='right') - 1, 0, len(self.times) - 1)
+        inside = (t >= self.times[0]) & (t <= self.times[-1])
+        return np.where(inside, self.capacities[inds], np.nan)
+
+    def coverage(self, starttime, endtime):
+        # Fraction of the time between starttime and endtime that the reports cover
+        if len(self.times) == 0 or endtime <= starttime:
+            return 0.0
+        overlap = min(endtime, self.times[-1]) - max(starttime, self.times[0])
+        return max(float(overlap), 0.0)/(endtime - starttime)
+
+    def drain_mwh(self, t0, t1):
+        return self.capacity(t0) - self.capacity(t1)
+
+    def drain_rate(self, t0, t1):
+        # Average drain rate (in mW)
+        duration = np.asarray(t1, dtype=np.float64) - np.asarray(t0, dtype=np.float64)
+        return millijoules_to_milliwatts(
+            milliwatthours_to_millijoules(self.drain_mwh(t0, t1)),
+            duration
+        )
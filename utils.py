@@ -1,4 +1,7 @@
 import os
+import re
+
+from concurrent.futures import ProcessPoolExecutor
 
 
 def pattern_find(srcf_to_find, sources):
@@ -11,15 +14,55 @@ def pattern_find(srcf_to_find, sources):
 	return None
 
 
+class PatternMatcher(object):
+	'''
+	Compiled version of `pattern_find`. All the patterns are joined into a
+	single regex once, so a lookup costs the same no matter how many
+	patterns were given. A `None` list, or an empty pattern, matches
+	everything.
+	'''
+	def __init__(self, sources):
+		self.match_all = sources is None or '' in sources
+		self.regex = None
+		if sources:
+			patterns = [re.escape(srcf) for srcf in sources if srcf]
+			if patterns:
+				self.regex = re.compile('|'.join(patterns))
+
+	def find(self, srcf_to_find):
+		# Returns the pattern that was found, like `pattern_find`
+		if self.regex is None:
+			return None
+		found = self.regex.search(srcf_to_find)
+		return found.group(0) if found else None
+
+	def matches(self, srcf_to_find):
+		return self.match_all or self.find(srcf_to_find) is not None
+
+
 def get_paths_from_dir(source_dir, file_matchers=None):
+	matcher = PatternMatcher(file_matchers)
 	paths = []
 	for root, _, files in os.walk(source_dir):
 		for file in files:
-			if pattern_find(file, file_matchers):
+			if matcher.matches(file):
 				paths.append(os.path.join(root, file))
 	return paths
 
 
+def parallel_map(func, items, jobs=None):
+	# Results are yielded in the same order as `items` no matter which
+	# worker finishes first, so merging them stays deterministic.
+	if not jobs or jobs <= 1:
+		for item in items:
+			yield func(item)
+		return
+
+	with ProcessPoolExecutor(max_workers=jobs) as executor:
+		for result in executor.map(func, items):
+			yield result
+
+
 def millijoules_to_joules(val):
 	return val/1000
 
@@ -36,20 +79,6 @@ def milliwatthours_to_millijoules(energy_consumed):
 	return energy_consumed*3600
 
 
-def get_ordered_datalist_power(datadict):
-	# Data must have already been merged!
-	sorted_list = []
-	for key in sorted(datadict):
-		newval = [key]
-		if type(datadict[key]) not in (list,):
-			newval.append(datadict[key])
-		else:
-			newval.extend(datadict[key])
-		sorted_list.append(newval)
-
-	return sorted_list
-
-
 def get_ordered_datalist_battery(datadict):
 	# Data must have already been merged!
 	sorted_list = []
@@ -1,7 +1,9 @@
 import io
 import argparse
 import os
+import re
 import json
+import math
 import time
 import psutil
 import subprocess
@@ -10,20 +12,114 @@ import ctypes
 
 from threading import Thread, Event
 
+try:
+    _kernel32 = ctypes.windll.kernel32
+except AttributeError:
+    # Not running on Windows (i.e. testing with a fake powercfg)
+    _kernel32 = None
+
+# This file is copied on its own, so the report patterns, the t table,
+# and the drain fit below are copies of the ones in batteryusageparser
+# and batteryanalysis. `fakepowercfg.py` checks that they still match.
+REPORT_LINE_PATTERN = re.compile(r'Report generated')
+PERCENT_PATTERN = re.compile(r'"percent">(\d+)')
+CAPACITY_PATTERN = re.compile(r'"mw">(.*) mWh')
+
+# Two-sided 95% critical values of Student's t distribution, keyed
+# on the degrees of freedom. Missing ones use the next lowest key.
+T_CRITICAL_95 = {
+    1: 12.706, 2: 4.303, 3: 3.182, 4: 2.776, 5: 2.571,
+    6: 2.447, 7: 2.365, 8: 2.306, 9: 2.262, 10: 2.228,
+    11: 2.201, 12: 2.179, 13: 2.160, 14: 2.145, 15: 2.131,
+    16: 2.120, 17: 2.110, 18: 2.101, 19: 2.093, 20: 2.086,
+    21: 2.080, 22: 2.074, 23: 2.069, 24: 2.064, 25: 2.060,
+    26: 2.056, 27: 2.052, 28: 2.048, 29: 2.045, 30: 2.042,
+    40: 2.021, 60: 2.000, 120: 1.980
+}
+
+
+def get_t_critical(dof):
+    if dof > max(T_CRITICAL_95):
+        return 1.960
+    return T_CRITICAL_95[max(k for k in T_CRITICAL_95 if k <= dof)]
+
 
 class disable_file_system_redirection:
     '''
     File System Redirection prevents us from running powercfg
     from 32-bit Python. Disable it with this context manager.
     '''
-    _disable = ctypes.windll.kernel32.Wow64DisableWow64FsRedirection
-    _revert = ctypes.windll.kernel32.Wow64RevertWow64FsRedirection
     def __enter__(self):
+        self.success = False
+        if _kernel32 is None:
+            return
         self.old_value = ctypes.c_long()
-        self.success = self._disable(ctypes.byref(self.old_value))
+        self.success = _kernel32.Wow64DisableWow64FsRedirection(ctypes.byref(self.old_value))
     def __exit__(self, type, value, traceback):
         if self.success:
-            self._revert(self.old_value)
+            _kernel32.Wow64RevertWow64FsRedirection(self.old_value)
+
+
+def get_battery_capacity(report):
+    # Finds the remaining capacity (in mWh) in a battery report, this
+    # file is used on its own so it doesn't use batteryusageparser.
+    reportLineFound = False
+    percentageFound = False
+    with open(report, 'r') as f:
+        for line in f:
+            if not reportLineFound:
+                reportLineFound = REPORT_LINE_PATTERN.search(line) is not None
+                continue
+            if PERCENT_PATTERN.search(line):
+                percentageFound = True
+                continue
+            if percentageFound:
+                matchObj = CAPACITY_PATTERN.search(line)
+                if matchObj:
+                    return int(matchObj.group(1).replace(',', ''))
+    return None
+
+
+class DrainEstimator(object):
+    '''
+    Running estimate of the battery drain rate. It is fitted with least
+    squares over the capacity steps seen so far, along with the
+    half-width of its 95% confidence interval.
+    '''
+    def __init__(self, min_steps=10):
+        # A few steps can line up perfectly by chance, which would
+        # give an empty interval, so wait for `min_steps` of them.
+        self.min_steps = max(min_steps, 3)
+        self.edges = []
+        self.last_capacity = None
+
+    def add(self, sampletime, capacity):
+        # The capacity is quantized, only keep the samples where it changes
+        if self.last_capacity is not None and capacity != self.last_capacity:
+            self.edges.append((sampletime, capacity))
+        self.last_capacity = capacity
+
+    def estimate(self):
+        # Returns (drain rate in mW, interval half-width in mW), or
+        # None when there aren't enough steps yet. This is the same
+        # fit as batteryanalysis.fit_drain_rate and must stay so.
+        n = len(self.edges)
+        if n < self.min_steps:
+            return None
+
+        tmean = sum(t for t, _ in self.edges)/n
+        cmean = sum(c for _, c in self.edges)/n
+        sxx = sum((t - tmean)**2 for t, _ in self.edges)
+        if sxx == 0:
+            return None
+        slope = sum((t - tmean)*(c - cmean) for t, c in self.edges)/sxx
+        ssr = sum((c - cmean - slope*(t - tmean))**2 for t, c in self.edges)
+
+        tcrit = get_t_critical(n - 2)
+        stderr = math.sqrt(ssr/(n - 2)/sxx)
+
+        # From mWh per second to mW
+        return -slope*3600, tcrit*stderr*3600
 
 
 class WinPowerUsageRunner(Thread):
@@ -36,6 +132,32 @@ class WinPowerUsageRunner(Thread):
         self.batteryusage = not args['no_battery_usage']
         self.output = args['output']
         self.poll_interval = args['poll_interval']
+        # Either a path, or a command given as a list of arguments
+        self.powercfg = args['powercfg']
+        if not isinstance(self.powercfg, list):
+            self.powercfg = [self.powercfg]
+        self.tolerance = args['tolerance']
+
+        # Set during the test phase when a tolerance is given,
+        # on_precise is called once the drain rate is within it.
+        self.estimator = None
+        self.on_precise = None
+
+    def update_estimate(self, estimator, report, currtime):
+        capacity = get_battery_capacity(report)
+        if capacity is None:
+            return
+
+        estimator.add(int(currtime), capacity)
+        estimate = estimator.estimate()
+        if estimate is None:
+            return
+
+        print("Current drain rate: %s mW (+/- %s mW)" % estimate)
+        if estimate[1] <= self.tolerance and self.on_precise is not None:
+            # Unless the phase changed while the report was read
+            if estimator is self.estimator:
+                self.on_precise()
 
     def run(self):
         while not self.kill_event.is_set():
@@ -48,23 +170,33 @@ class WinPowerUsageRunner(Thread):
 
             if self.powerusage:
                 # Call powercfg.exe /SRUMUTIL   
-                command = ['powercfg.exe', '/SRUMUTIL', '/CSV', '/OUTPUT']
+                command = self.powercfg + ['/SRUMUTIL', '/CSV', '/OUTPUT']
                 command.append(os.path.join(self.output,'srumutil' + currtime + '.csv'))
                 with disable_file_system_redirection():
                     subprocess.check_call(command)
 
             if self.batteryusage:
                 # Call powercfg.exe /BATTERYREPORT
-                command = ['powercfg.exe', '/BATTERYREPORT', '/OUTPUT']
-                command.append(os.path.join(self.output,'batteryreport' + currtime + '.html'))
+                report = os.path.join(self.output,'batteryreport' + currtime + '.html')
+                command = self.powercfg + ['/BATTERYREPORT', '/OUTPUT']
+                command.append(report)
                 with disable_file_system_redirection():
                     subprocess.check_call(command)
 
+                # The main thread can reset the estimator at any
+                # time, only use the one that was set at this point.
+                estimator = self.estimator
+                if estimator is not None:
+                    self.update_estimate(estimator, report, currtime)
+
 
 class WinPowerUsage(object):
-    def __init__(self, topdir, output):
+    def __init__(self, topdir, output, powercfg='powercfg.exe', tolerance=None, poll_interval=60):
+        # With a `tolerance` (in mW), the test phase is stopped as soon as
+        # the 95% confidence interval of the drain rate is within it.
         self.topdir = topdir
         self.output = output
+        self.tolerance = tolerance
         self.current_analysis = None
         self.config = {}
 
@@ -78,17 +210,23 @@ class WinPowerUsage(object):
         # Kills the thread entirely
         self.kill_event = Event()
 
+        # Set when the test was stopped early
+        self.precise_event = Event()
+
         self.runner = WinPowerUsageRunner(
             args={
                 'no_power_usage': False,
                 'no_battery_usage': False,
                 'output': output,
-                'poll_interval': 60
+                'poll_interval': poll_interval,
+                'powercfg': powercfg,
+                'tolerance': tolerance
             },
             stop_event=self.stop_event,
             start_event=self.start_event,
             kill_event=self.kill_event
         )
+        self.runner.on_precise = self.precise_stop
         self.runner.start()
 
     def log_start(self):
@@ -99,13 +237,29 @@ class WinPowerUsage(object):
 
     def stop(self):
         # Stops gathering data
+        if not self.start_event.is_set():
+            # Already stopped
+            return
+        self.runner.estimator = None
         self.log_stop()
         self.start_event.clear()
         self.stop_event.set()
 
+    def precise_stop(self):
+        # Called by the runner once the drain rate is within the tolerance
+        print("The drain rate is within %s mW, stopping the test." % self.tolerance)
+        self.precise_event.set()
+        self.stop()
+
+    def wait_until_precise(self, timeout):
+        # Waits until the test is stopped early, or for `timeout` seconds.
+        # Returns True if the drain rate reached the tolerance.
+        return self.precise_event.wait(timeout)
+
     def baseline_start(self):
         # Starts gathering data
         self.current_analysis = 'baseline'
+        self.runner.estimator = None
         self.log_start()
         self.stop_event.clear()
         self.start_event.set()
@@ -131,6 +285,9 @@ class WinPowerUsage(object):
     def test_start(self):
         self.current_analysis = 'test'
         self.log_start()
+        if self.tolerance is not None:
+            self.precise_event.clear()
+            self.runner.estimator = DrainEstimator()
         self.stop_event.clear()
         self.start_event.set()
 
@@ -2,53 +2,89 @@ import os
 import re
 import time
 import datetime
+import io
 import csv
+import mmap
+import array
+import functools
 import numpy as np
 
+from resampling import make_time_index, resample
 from utils import (
     get_paths_from_dir,
+    parallel_map,
     pattern_find
 )
 
-KNOWN_TABLES = [
-    'Processes_Summary_Table_Lifetime_By_Process.',
-    'Disk_Usage_Utilization_by_Process,_Path_Name,_Stack',
-    'CPU_Usage_(Precise)_Utilization_by_Process,_Thread.'
-]
+# The process table holds the wpr.exe markers used to find the test borders
+COMMAND_TABLE = 'Processes_Summary_Table_Lifetime_By_Process'
 
+# Specs of the WPA table exports that are processed, keyed on the name
+# the export files contain. Use register_wpa_table to add more of them.
+WPA_TABLES = {}
 
-def open_wpa_csv(wpa_csv):
+
+def register_wpa_table(name, time_column=0, value_column=1):
+    WPA_TABLES[name] = {
+        'time_column': time_column,
+        'value_column': value_column
+    }
+
+
+register_wpa_table('Disk_Usage_Utilization_by_Process,_Path_Name,_Stack')
+register_wpa_table('CPU_Usage_(Precise)_Utilization_by_Process,_Thread.')
+
+# Size of the chunks read at a time from memory-mapped WPA tables
+WPA_CHUNK_SIZE = 2**24
+
+
+def read_wpa_columns(wpa_csv, columns, text_columns=()):
+    # Only keeps the given columns of a WPA export. Numbers are parsed
+    # into float arrays as the rows are read, dropping the thousands
+    # separators WPA adds, and `text_columns` are kept as strings.
+    # Empty rows, or rows too short to hold the columns, are skipped.
     with open(wpa_csv, 'r') as csvfile:
-        print("Opening")
         rdr = csv.reader(csvfile, delimiter=',')
-        print("Opened")
+        header = next(rdr, [])
 
-        header = []
-        data = []
-        for i, row in enumerate(rdr):
-            if i == 0:
-                header = row
+        is_text = [col in text_columns for col in columns]
+        data = [[] if text else array.array('d') for text in is_text]
+        for row in rdr:
+            if len(row) <= max(columns):
                 continue
-            data.append(row)
+            for values, col, text in zip(data, columns, is_text):
+                if text:
+                    values.append(row[col])
+                else:
+                    values.append(float(row[col].replace(',', '')))
 
-    return header, data
+    return header, [
+        values if text else np.frombuffer(values, dtype=np.float64)
+        for values, text in zip(data, is_text)
+    ]
 
 
 def get_borders(command_file, testtime):
-    header, data = open_wpa_csv(command_file)
+    header, (names, start_times, end_times) = read_wpa_columns(
+        command_file, [5, 6, 7], text_columns=[5, 6, 7]
+    )
 
-    datmat = np.asmatrix(data)
-    names = datmat[:, 5]
-    start_times = datmat[:, 6]
-    end_times = datmat[:, 7]
+    # The last markers found in the command column are used, only
+    # their times are parsed since other processes can have blank ones
+    names = np.asarray(names, dtype=str)
+    start_markers = np.char.find(names, 'wpr.exe -start') >= 0
+    stop_markers = (
+        ~start_markers &
+        (np.char.find(names, 'wpr.exe') >= 0) &
+        (np.char.find(names, 'stop-') >= 0)
+    )
 
     starttime = None
     endtime = None
-    for i, command in enumerate(names):
-        if 'wpr.exe -start' in command[0,0]:
-            starttime = float(end_times[i,0])
-        elif 'wpr.exe' in command[0,0] and 'stop-' in command[0,0]:
-            endtime = float(start_times[i,0])
+    if np.any(start_markers):
+        starttime = float(end_times[np.flatnonzero(start_markers)[-1]].replace(',', ''))
+    if np.any(stop_markers):
+        endtime = float(start_times[np.flatnonzero(stop_markers)[-1]].replace(',', ''))
     if not endtime and not starttime:
         print(
             "Cannot find markers expect huge errors in synchronization (>20s)"
@@ -67,62 +103,173 @@ def get_borders(command_file, testtime):
     return starttime, endtime
 
 
-def get_wpa_data(testdir, apps, excluded_apps, testtime):
+def iter_wpa_chunks(wpa_csv, columns, chunksize=WPA_CHUNK_SIZE):
+    # Memory-maps a WPA export and yields the given columns as float
+    # arrays for each chunk of rows, so that the table never has to fit
+    # in memory. Chunks always end on a line break.
+    with open(wpa_csv, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            # Skip the header
+            start = mm.find(b'\n') + 1
+            while 0 < start < len(mm):
+                end = mm.find(b'\n', min(start + chunksize, len(mm)) - 1)
+                end = len(mm) if end == -1 else end + 1
+
+                rdr = csv.reader(io.StringIO(mm[start:end].decode('utf-8', 'replace')))
+                data = [array.array('d') for _ in columns]
+                for row in rdr:
+                    if len(row) <= max(columns):
+                        continue
+                    for values, col in zip(data, columns):
+                        values.append(float(row[col].replace(',', '')))
+                yield [np.frombuffer(values, dtype=np.float64) for values in data]
+
+                start = end
+        finally:
+            mm.close()
+
+
+def interp_wpa_table_chunked(wpa_csv, starttime, endtime, xvals, trim_start=True,
+                             chunksize=WPA_CHUNK_SIZE, columns=(0, 1)):
+    # Same as trimming the table to [starttime, endtime] and calling np.interp
+    # on it (`xvals` counts from the start time), but done one chunk at a
+    # time. Each chunk is interpolated along with the last sample of the
+    # previous one so no interval is missed.
+    interp = np.empty(len(xvals))
+    first = None
+    prev = None
+    for times, data in iter_wpa_chunks(wpa_csv, list(columns), chunksize=chunksize):
+        if trim_start and first is None:
+            first_ind = np.searchsorted(times, starttime, side='left')
+            times = times[first_ind:]
+            data = data[first_ind:]
+
+        # Rows are in order, everything after the first sample
+        # at (or past) the end time can be ignored.
+        last_ind = np.searchsorted(times, endtime, side='left')
+        finished = last_ind < len(times)
+        times = times[:last_ind+1] - starttime
+        data = data[:last_ind+1]
+
+        if len(times) > 0:
+            if first is None:
+                first = (times[0], data[0])
+            else:
+                times = np.concatenate(([prev[0]], times))
+                data = np.concatenate(([prev[1]], data))
+
+            lo = np.searchsorted(xvals, times[0], side='left')
+            hi = np.searchsorted(xvals, times[-1], side='right')
+            interp[lo:hi] = np.interp(xvals[lo:hi], times, data)
+            prev = (times[-1], data[-1])
+
+        if finished:
+            break
+
+    if first is None:
+        if trim_start:
+            # Nothing is past the start time, use the whole table
+            return interp_wpa_table_chunked(
+                wpa_csv, starttime, endtime, xvals, trim_start=False, chunksize=chunksize,
+                columns=columns
+            )
+        raise ValueError("No data found in the WPA table %s" % wpa_csv)
+
+    # Values outside of the samples are held, like np.interp
+    interp[:np.searchsorted(xvals, first[0], side='left')] = first[1]
+    interp[np.searchsorted(xvals, prev[0], side='right'):] = prev[1]
+    return interp
+
+
+def get_wpa_table_name(file):
+    for table in WPA_TABLES:
+        if pattern_find(file, [table]):
+            return table
+    return None
+
+
+def process_wpa_table(item, starttime, endtime, out_of_core=False, period=1/60, method='linear'):
+    # Processes a single table given as (file, name, spec), the spec is
+    # sent along so tables registered at runtime also work in workers.
+    file, name, spec = item
+    print("Processing {}...".format(str(file)))
+    columns = [spec['time_column'], spec['value_column']]
+
+    # The time index, and the samples put on it, start at the start time
+    xvals = make_time_index(0, endtime-starttime, period)
+    if out_of_core:
+        if method != 'linear':
+            raise ValueError("Only linear resampling is supported for out-of-core WPA tables")
+        with open(file, 'r') as csvfile:
+            header = next(csv.reader(csvfile, delimiter=','), [])
+        return name, header, {
+            'times': xvals,
+            'data': list(interp_wpa_table_chunked(file, starttime, endtime, xvals, columns=columns)),
+            'srate': 1/period
+        }
+
+    header, (times, data) = read_wpa_columns(file, columns)
+
+    # Times are sorted, binary search for the first samples at
+    # (or past) the start and end times to trim the table
+    if times[0] < starttime:
+        first_ind = np.searchsorted(times, starttime, side='left')
+        if first_ind == len(times):
+            first_ind = 0
+        times = times[first_ind:]
+        data = data[first_ind:]
+    if times[-1] > endtime:
+        last_ind = np.searchsorted(times, endtime, side='left')
+        times = times[:last_ind+1]
+        data = data[:last_ind+1]
+
+    return name, header, {
+        'times': xvals,
+        'data': list(resample(times - starttime, data, xvals, method=method)),
+        'srate': 1/period
+    }
+
+
+def get_wpa_data(testdir, apps, excluded_apps, testtime, jobs=None, out_of_core=False,
+                 period=1/60, method='linear'):
     print("Getting WPA data...")
-    files = get_paths_from_dir(os.path.join(testdir, 'etl-data'), file_matchers=KNOWN_TABLES)
+    files = get_paths_from_dir(
+        os.path.join(testdir, 'etl-data'), file_matchers=[COMMAND_TABLE] + list(WPA_TABLES)
+    )
 
+    command_file = None
     for file in files:
-        command_file = pattern_find(file, ['Processes_Summary_Table_Lifetime_By_Process'])
-        if command_file:
+        if pattern_find(file, [COMMAND_TABLE]):
             command_file = file
             break
 
-    files = list(set(files) - set([command_file]))
+    # The borders are found once and shared by all the tables
     starttime, endtime = get_borders(command_file, testtime)
     print("Start time: {}, End time: {}".format(str(starttime), str(endtime)))
 
-    currdata = {}
-    for i, file in enumerate(files):
-        print("Processing {}...".format(str(file)))
-        header, data = open_wpa_csv(file)
-
-        name = ''
-        for table in KNOWN_TABLES:
-            if pattern_find(file, [table]):
-                name = table
-                break
-
-        # Expecting times as the first column, and 
-        # data as the second column
-        times = [float(t[0,0].replace(',', '')) for t in np.asmatrix(data)[:,0]]
-        data = [float(d[0,0].replace(',', '')) for d in np.asmatrix(data)[:,1]]
-        if times[0] < starttime:
-            first_ind = 0
-            for i, t in enumerate(times):
-                if t < starttime:
-                    continue
-                else:
-                    first_ind = i
-                    break
-            times = times[first_ind:]
-            data = data[first_ind:]
-        if times[-1] > endtime:
-            last_ind = len(times) - 1
-            for i, t in enumerate(times):
-                if t < endtime:
-                    continue
-                else:
-                    last_ind = i
-                    break
-            times = times[:last_ind+1]
-            data = data[:last_ind+1]
+    tables = []
+    for file in sorted(set(files) - set([command_file])):
+        name = get_wpa_table_name(file)
+        if name is None:
+            # i.e. another process table, only the first one is used
+            print("Skipping unknown WPA table %s" % file)
+            continue
+        tables.append((file, name, WPA_TABLES[name]))
 
-        xvals = np.arange(0, endtime-starttime, 1/60)
-        currdata[name] = {
-            'times': xvals,
-            'data': list(np.interp(xvals, times, data)),
-            'srate': 60
-        }
+    # The tables are independent of each other, with --jobs
+    # they are processed by a pool of workers
+    process = functools.partial(
+        process_wpa_table, starttime=starttime, endtime=endtime, out_of_core=out_of_core,
+        period=period, method=method
+    )
+
+    header = []
+    currdata = {}
+    for name, header, entry in parallel_map(process, tables, jobs=jobs):
+        currdata[name] = entry
 
     print("Total datapoints found: %s" % len(list(currdata.keys())))
 